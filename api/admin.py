@@ -1,6 +1,246 @@
+from datetime import date
+from functools import partial
+
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, ForeignKey, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+from .changes import record_modification_deletes
+from .models import Report, Source, Modification
+from .rollups import get_rollup
+from .sharding import get_shards, shard_for_id
+
+
+def get_estimated_count(model, using):
+    """
+        Returns the number of rows of the table of `model` from the statistics of the database,
+        or None when the database has no statistics for it.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            return int(row[0]) if row is not None and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 is only created by ANALYZE
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row is not None else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Paginator of the large changelists: when nothing is filtered and the table is big, the
+        number of rows is read from the statistics of the database instead of counting them.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = get_estimated_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+        Chooses the shard listed by the changelist, the first shard by default.
+        Hidden when there is only one shard.
+    """
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        shards = get_shards()
+        return [(shard, shard) for shard in shards] if len(shards) > 1 else []
+
+    def choices(self, changelist):
+        current = self.value() or get_shards()[0]
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': current == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() in get_shards():
+            return queryset.using(self.value())
+        return queryset
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+        Admin of the tables that can be big: the pages are counted with EstimatedCountPaginator
+        and the objects are read from the shard encoded in their id.
+        The foreign keys of the form are checked on the shard of the object, given for a new
+        object by its `shard_field`.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    shard_field = None
+
+    def get_form_shard(self, request, obj=None):
+        if obj is not None:
+            return obj._state.db
+        if self.shard_field is not None:
+            return shard_for_id(request.POST.get(self.shard_field) or request.GET.get(self.shard_field))
+        return get_shards()[0]
+
+    def get_form(self, request, obj=None, change=False, **kwargs):
+        kwargs['formfield_callback'] = partial(self.formfield_for_shard, request=request, using=self.get_form_shard(request, obj))
+        return super().get_form(request, obj, change, **kwargs)
+
+    def formfield_for_shard(self, db_field, request, using, **kwargs):
+        if isinstance(db_field, ForeignKey):
+            kwargs['using'] = using
+        return self.formfield_for_dbfield(db_field, request, **kwargs)
+
+    def get_object(self, request, object_id, from_field=None):
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+            return self.get_queryset(request).using(shard_for_id(object_id)).get(**{field.name: object_id})
+        except (self.model.DoesNotExist, ValidationError, ValueError):
+            return None
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+        Inline formset that only edits the objects of the current page (see PaginatedTabularInline).
+    """
+    page = None
+    page_param = None
+
+    def __init__(self, *args, instance=None, queryset=None, **kwargs):
+        if self.page is not None:
+            queryset = queryset.using(instance._state.db).filter(pk__in=list(self.page.object_list))
+        super().__init__(*args, instance=instance, queryset=queryset, **kwargs)
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """
+        Tabular inline showing `per_page` objects at a time, the page is given by `page_param`.
+    """
+    formset = PaginatedInlineFormSet
+    template = 'admin/api/paginated_tabular.html'
+    per_page = 20
+    page_param = 'inline_page'
+    ordering = ('id',)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        if obj is None:
+            return formset
+        ids = (
+            self.model.objects.using(obj._state.db)
+            .filter(**{formset.fk.name: obj})
+            .order_by(*self.ordering)
+            .values_list('pk', flat=True)
+        )
+        page = Paginator(ids, self.per_page).get_page(request.GET.get(self.page_param))
+        return type(formset.__name__, (formset,), {'page': page, 'page_param': self.page_param})
+
+
+class ModificationInline(PaginatedTabularInline):
+    model = Modification
+    ordering = ('acquisition_year', 'id')
+    extra = 0
+
+
+@admin.register(Report)
+class ReportAdmin(ShardedModelAdmin):
+    list_display = ('id', 'name', 'date', 'nb_sources', 'nb_modifications', 'total_emission', 'year_emission')
+    list_filter = (ShardListFilter, ('date', admin.DateFieldListFilter))
+    search_fields = ('^name',)
+
+    def get_queryset(self, request):
+        sources = Source.objects.filter(report=OuterRef('pk')).order_by().values('report')
+        modifications = Modification.objects.filter(source__report=OuterRef('pk')).order_by().values('source__report')
+        return super().get_queryset(request).annotate(
+            nb_sources=Coalesce(Subquery(sources.annotate(n=Count('id')).values('n')), 0),
+            nb_modifications=Coalesce(Subquery(modifications.annotate(n=Count('id')).values('n')), 0),
+            total_emission=(
+                Coalesce(Subquery(sources.annotate(total=Sum('total_emission')).values('total')), 0.0, output_field=FloatField())
+                + Coalesce(Subquery(modifications.annotate(total=Sum('total_emission')).values('total')), 0.0, output_field=FloatField())
+            ),
+        )
+
+    def get_changelist_instance(self, request):
+        """
+            Computes the emissions of the current year of the reports of the page in one rollup,
+            a fixed number of queries whatever the number of reports shown.
+        """
+        changelist = super().get_changelist_instance(request)
+        year = date.today().year
+        reports = list(changelist.result_list)
+        rollup = get_rollup([report.id for report in reports], 'report', year, year, using=changelist.result_list.db)
+        for report in reports:
+            report.year_emission = rollup.get(report.id, {}).get(year, 0)
+        return changelist
+
+    @admin.display(description='sources', ordering='nb_sources')
+    def nb_sources(self, obj):
+        return obj.nb_sources
+
+    @admin.display(description='modifications', ordering='nb_modifications')
+    def nb_modifications(self, obj):
+        return obj.nb_modifications
+
+    @admin.display(description='total emission (kg)', ordering='total_emission')
+    def total_emission(self, obj):
+        return round(obj.total_emission, 2)
+
+    @admin.display(description='emission this year (kg)')
+    def year_emission(self, obj):
+        return round(getattr(obj, 'year_emission', 0), 2)
+
+
+@admin.register(Source)
+class SourceAdmin(ShardedModelAdmin):
+    list_display = ('id', 'description', 'report', 'value', 'emission_factor', 'total_emission', 'lifetime', 'acquisition_year')
+    list_select_related = ('report',)
+    list_filter = (ShardListFilter, 'acquisition_year')
+    search_fields = ('^description',)
+    raw_id_fields = ('report',)
+    shard_field = 'report'
+    inlines = [ModificationInline]
+
+    def save_formset(self, request, form, formset, change):
+        deleted = [deleted_form.instance.pk for deleted_form in formset.deleted_forms if deleted_form.instance.pk is not None]
+        if deleted:
+            record_modification_deletes(Modification.objects.using(form.instance._state.db).filter(pk__in=deleted))
+        super().save_formset(request, form, formset, change)
+
+
+@admin.register(Modification)
+class ModificationAdmin(ShardedModelAdmin):
+    list_display = ('id', 'description', 'source', 'ratio', 'emission_factor', 'total_emission', 'lifetime', 'acquisition_year')
+    list_select_related = ('source',)
+    list_filter = (ShardListFilter, ('acquisition_year', admin.DateFieldListFilter))
+    search_fields = ('^description',)
+    raw_id_fields = ('source',)
+    shard_field = 'source'
 
-from .models import Report, Source
+    def delete_model(self, request, obj):
+        record_modification_deletes(Modification.objects.using(obj._state.db).filter(pk=obj.pk))
+        super().delete_model(request, obj)
 
-admin.site.register(Report)
-admin.site.register(Source)
\ No newline at end of file
+    def delete_queryset(self, request, queryset):
+        record_modification_deletes(queryset)
+        super().delete_queryset(request, queryset)
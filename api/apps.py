@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .changes import connect_signals
+        from .sharding import check_shards, initialize_shard
+        check_shards()
+        connect_signals()
+        post_migrate.connect(initialize_shard, sender=self)
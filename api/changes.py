@@ -0,0 +1,100 @@
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, pre_delete
+
+from .models import ChangeLogEntry, Modification, Report, Source
+
+
+def get_report_id(instance):
+    if isinstance(instance, Report):
+        return instance.id
+    if isinstance(instance, Source):
+        return instance.report_id
+    return instance.source.report_id
+
+
+def record_changes(model, instances, action, report_id):
+    """
+        Appends one entry per instance of the report `report_id` to the change log, in one insert.
+        Used after bulk operations, which do not send the model signals.
+    """
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=model._meta.model_name, object_id=instance.id, action=action, report_id=report_id)
+        for instance in instances
+    ], batch_size=2000)
+
+
+def record_deletes(rows):
+    """
+        Appends a delete entry for each (model, id, report_id) of `rows`, in one insert.
+    """
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=model._meta.model_name, object_id=object_id, action=ChangeLogEntry.DELETE, report_id=report_id)
+        for model, object_id, report_id in rows
+    ], batch_size=2000)
+
+
+def record_modification_deletes(modifications):
+    """
+        Logs the deletion of the modifications of the queryset `modifications`, before they are deleted.
+        Modification has no delete receiver, so that Django deletes them in one query on a cascade:
+        the code deleting modifications directly (the admin) calls this.
+    """
+    record_deletes(
+        (Modification, modif_id, report_id)
+        for modif_id, report_id in modifications.values_list('id', 'source__report_id')
+    )
+
+
+def log_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ChangeLogEntry.objects.create(
+            model=sender._meta.model_name, object_id=instance.id, action=ChangeLogEntry.CREATE, report_id=get_report_id(instance)
+        )
+
+
+def log_delete(sender, instance, origin=None, **kwargs):
+    """
+        Logs a deletion of reports or sources and everything it cascades to. Django sends the signal
+        for every object deleted, with the object or queryset whose deletion started it (`origin`):
+        the whole deletion is logged on the first signal, in two reads and one insert.
+        The change log is on the default database: for a report on another shard, the insert is
+        only made once the delete is committed on the shard.
+    """
+    origin = instance if origin is None else origin
+    if getattr(origin, '_changes_logged', False):
+        return
+    origin._changes_logged = True
+
+    if isinstance(origin, QuerySet):
+        model, db, ids = origin.model, origin.db, list(origin.values_list('id', flat=True))
+    else:
+        model, db, ids = type(origin), origin._state.db, [origin.id]
+
+    if model is Report:
+        rows = [(Report, report_id, report_id) for report_id in ids]
+        sources = Source.objects.using(db).filter(report__in=ids)
+    elif model is Source:
+        rows = []
+        sources = Source.objects.using(db).filter(id__in=ids)
+    else:
+        return
+    rows += [(Source, source_id, report_id) for source_id, report_id in sources.values_list('id', 'report_id')]
+    rows += [
+        (Modification, modif_id, report_id)
+        for modif_id, report_id in Modification.objects.using(db).filter(source__in=sources).values_list('id', 'source__report_id')
+    ]
+    if db == DEFAULT_DB_ALIAS:
+        record_deletes(rows)
+    else:
+        transaction.on_commit(partial(record_deletes, rows), using=db)
+
+
+def connect_signals():
+    for model in (Report, Source, Modification):
+        post_save.connect(log_save, sender=model, dispatch_uid='changelog_save_%s' % model._meta.model_name)
+    # Not on Modification, see record_modification_deletes
+    for model in (Report, Source):
+        pre_delete.connect(log_delete, sender=model, dispatch_uid='changelog_delete_%s' % model._meta.model_name)
@@ -0,0 +1,198 @@
+"""
+    Batched evaluation of the emissions of many sources.
+
+    The model methods (Source.get_total_emissions, Source.get_delta, ...) compute one
+    source for one year. Here the sources and modifications are loaded once as light
+    tuples, and the yearly series of a source is built with a difference array: every
+    amortization and every usage period is a constant added over a range of years, so a
+    source costs O(1 + number of modifications) whatever the number of years.
+
+    The functions only read attributes, so they also accept Source and Modification instances.
+"""
+from collections import defaultdict, namedtuple
+
+SOURCE_FIELDS = ('id', 'report_id', 'description', 'value', 'emission_factor', 'total_emission', 'lifetime', 'acquisition_year')
+MODIFICATION_FIELDS = ('id', 'source_id', 'ratio', 'emission_factor', 'total_emission', 'acquisition_year', 'lifetime')
+
+SourceRow = namedtuple('SourceRow', SOURCE_FIELDS)
+ModificationRow = namedtuple('ModificationRow', MODIFICATION_FIELDS)
+
+
+def load_sources(queryset):
+    """
+        Loads the sources of `queryset` as SourceRow, in one query.
+    """
+    return [SourceRow._make(row) for row in queryset.values_list(*SOURCE_FIELDS).iterator(chunk_size=10000)]
+
+
+def load_modifications(queryset):
+    """
+        Loads the modifications of `queryset` as ModificationRow, in one query,
+        grouped by source and ordered by acquisition date.
+    """
+    modifs_by_source = defaultdict(list)
+    rows = queryset.order_by('acquisition_year', 'id').values_list(*MODIFICATION_FIELDS).iterator(chunk_size=10000)
+    for row in rows:
+        modif = ModificationRow._make(row)
+        modifs_by_source[modif.source_id].append(modif)
+    return modifs_by_source
+
+
+def add_range(diff, start, end, first, last, value):
+    """
+        Adds `value` to every year of [first, last) that is in the window [start, end].
+    """
+    first = max(first, start)
+    last = min(last, end + 1)
+    if first < last:
+        diff[first - start] += value
+        diff[last - start] -= value
+
+
+def add_source_emissions(diff, source, modifs, start, end):
+    """
+        Adds the yearly emissions of `source` between `start` and `end` to the difference array
+        `diff` (of length end - start + 2). `modifs` must be ordered by acquisition date.
+    """
+    acquisition_year = source.acquisition_year
+
+    # Amortization of the source, a lifetime of 0 means nothing is amortized
+    if source.lifetime:
+        add_range(diff, start, end, acquisition_year, acquisition_year + source.lifetime, source.total_emission / source.lifetime)
+
+    # Usage emissions, driven by the closest modification before each year
+    usage_year = acquisition_year
+    usage = source.emission_factor * source.value
+    closest = None
+    for modif in modifs:
+        if closest is None or modif.acquisition_year > closest.acquisition_year:
+            closest = modif
+            year = max(modif.acquisition_year.year, acquisition_year)
+            add_range(diff, start, end, usage_year, year, usage)
+            usage_year = year
+            usage = modif.emission_factor * (modif.ratio * source.value)
+    add_range(diff, start, end, usage_year, end + 1, usage)
+
+    # Amortization of the modifications, nothing is emitted before the source is acquired
+    for modif in modifs:
+        if not modif.lifetime:
+            continue
+        modif_year = modif.acquisition_year.year
+        add_range(diff, start, end, max(modif_year, acquisition_year), modif_year + modif.lifetime, modif.total_emission / modif.lifetime)
+
+
+def get_total(source, modifs):
+    """
+        Total emissions of the source without amortization, as Source.get_total_emissions(year=None).
+    """
+    total = 0
+    for modif in modifs:
+        total += modif.total_emission
+    return source.total_emission + total
+
+
+def get_series(source, modifs, start, end):
+    """
+        Returns the emissions of `source` for every year from `start` to `end` (included).
+    """
+    diff = [0.0] * (end - start + 2)
+    add_source_emissions(diff, source, modifs, start, end)
+    return integrate(diff, start, end)
+
+
+def integrate(diff, start, end):
+    """
+        Turns a difference array into {year: value}.
+    """
+    series = {}
+    value = 0.0
+    for i in range(end - start + 1):
+        value += diff[i]
+        series[start + i] = value
+    return series
+
+
+def get_delta(source, modifs, year=None):
+    """
+        Same as Source.get_delta, for a source and its modifications ordered by acquisition date.
+    """
+    if year == source.acquisition_year or not modifs:
+        return 0
+
+    if year is not None:
+        modifs = [modif for modif in modifs if modif.acquisition_year.year <= year]
+        if not modifs:
+            return 0
+
+    last_modif = modifs[-1]
+    if len(modifs) > 1:
+        before_last_modif = modifs[-2]
+        usage_before = before_last_modif.emission_factor * (before_last_modif.ratio * source.value)
+    else:
+        usage_before = source.emission_factor * source.value
+    usage_emission_delta = (last_modif.emission_factor * (last_modif.ratio * source.value)) - usage_before
+    amortissement_delta = last_modif.total_emission / last_modif.lifetime if last_modif.lifetime else 0
+
+    if year is not None and (year - last_modif.acquisition_year.year) >= last_modif.lifetime:
+        return usage_emission_delta
+    return amortissement_delta + usage_emission_delta
+
+
+def get_projection(source, modifs, year=None, to=None):
+    """
+        Returns the total emission, the delta and the list of emission of a source, as returned
+        by the source endpoints: {"total": total} without year, {year: emission} from `year` to `to` otherwise.
+    """
+    if year is None:
+        total_emission = get_total(source, modifs)
+        return total_emission, get_delta(source, modifs), {"total": total_emission}
+
+    list_of_emission = get_series(source, modifs, year, to if to is not None and to > year else year)
+    return list_of_emission[year], get_delta(source, modifs, year), list_of_emission
+
+
+def get_prefix_sums(series, start, end):
+    """
+        Returns the prefix sums of a yearly series: prefix[i] is the sum of the years from `start`
+        to start + i - 1, so the sum over any range of years is the difference of two values.
+    """
+    prefix = [0.0] * (end - start + 2)
+    for i in range(end - start + 1):
+        prefix[i + 1] = prefix[i] + series[start + i]
+    return prefix
+
+
+def range_sum(prefix, start, first, last):
+    """
+        Sum of the years `first` to `last` (included) of the series whose prefix sums start at `start`.
+    """
+    return prefix[last - start + 1] - prefix[first - start]
+
+
+def get_cumulative(prefix, start, end):
+    """
+        Returns {year: sum of the emissions from `start` to year}.
+    """
+    return {year: range_sum(prefix, start, start, year) for year in range(start, end + 1)}
+
+
+def get_windows(prefix, start, end, size):
+    """
+        Returns {year: sum of the `size` years ending at year}, for every full window between `start` and `end`.
+    """
+    return {year: range_sum(prefix, start, year - size + 1, year) for year in range(start + size - 1, end + 1)}
+
+
+def get_modification_impact(source, modifs, modif, year=None, to=None):
+    """
+        Returns the change of the total emission, the delta and the list of emission of `source`
+        (see get_projection) caused by adding `modif` to its modifications `modifs`.
+    """
+    total_before, delta_before, list_before = get_projection(source, modifs, year, to)
+    modifs = sorted(list(modifs) + [modif], key=lambda m: (m.acquisition_year, m.id))
+    total_after, delta_after, list_after = get_projection(source, modifs, year, to)
+    return (
+        total_after - total_before,
+        delta_after - delta_before,
+        {key: list_after[key] - list_before[key] for key in list_after},
+    )
@@ -0,0 +1,156 @@
+"""
+    Local worker pool for long report projections.
+
+    A job is stored in the database (ProjectionJob), on the shard of its report, and computed by a thread of the pool,
+    so no outside broker is needed. Identical requests on the same data share the same job,
+    the number of jobs computed at the same time is capped by PROJECTION_JOB_WORKERS and
+    the results are kept PROJECTION_JOB_TTL seconds. A job still running PROJECTION_JOB_TIMEOUT
+    seconds after it started is considered dead (its process was restarted) and failed.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ChangeLogEntry, ProjectionJob, ReportSnapshot, Source
+from .sharding import get_shards
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PROJECTION_JOB_WORKERS', 2),
+                thread_name_prefix='projection-job',
+            )
+        return _executor
+
+
+def get_data_version(report):
+    """
+        Returns the version of the data a projection of `report` reads: the last change logged
+        for the report (a source or a modification created or deleted) and its latest snapshot.
+    """
+    last_change = ChangeLogEntry.objects.filter(report_id=report.id).aggregate(last=Max('id'))['last']
+    snapshot = (
+        ReportSnapshot.objects.using(report._state.db).filter(report=report)
+        .order_by('-created_at', '-id').values_list('id', flat=True).first()
+    )
+    return "%s:%s" % (last_change, snapshot)
+
+
+def get_job_key(report_id, year=None, to=None, version=None):
+    """
+        Returns the deduplication key of a projection request on the data `version`.
+    """
+    return hashlib.sha256(("%s:%s:%s:%s" % (report_id, year, to, version)).encode()).hexdigest()
+
+
+def get_expiry_limit():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'PROJECTION_JOB_TTL', 3600))
+
+
+def purge_expired_jobs():
+    """
+        Deletes the finished jobs whose result has expired.
+    """
+    for shard in get_shards():
+        ProjectionJob.objects.using(shard).filter(
+            status__in=[ProjectionJob.DONE, ProjectionJob.FAILED], finished_at__lt=get_expiry_limit()
+        ).delete()
+
+
+def fail_dead_jobs():
+    """
+        Fails the jobs running for more than PROJECTION_JOB_TIMEOUT seconds. Their worker is gone,
+        they would otherwise never finish, be returned to every identical request and count towards
+        PROJECTION_JOB_MAX_PENDING forever. The time spent queued does not count.
+    """
+    limit = timezone.now() - timedelta(seconds=getattr(settings, 'PROJECTION_JOB_TIMEOUT', 600))
+    for shard in get_shards():
+        ProjectionJob.objects.using(shard).filter(
+            status=ProjectionJob.RUNNING, started_at__lt=limit
+        ).update(status=ProjectionJob.FAILED, error="Timed out", finished_at=timezone.now())
+
+
+def submit_job(report, year=None, to=None):
+    """
+        Returns the job computing the projection of `report` over `year..to`.
+        If an identical job on the same data is queued, running or has a result that has not expired, it is reused.
+        Raises QueueFull when too many jobs are waiting.
+    """
+    purge_expired_jobs()
+    fail_dead_jobs()
+    key = get_job_key(report.id, year, to, get_data_version(report))
+    db = report._state.db
+
+    with transaction.atomic(using=db):
+        job = ProjectionJob.objects.using(db).filter(key=key).exclude(status=ProjectionJob.FAILED).order_by('-created_at').first()
+        if job is not None:
+            return job, False
+
+        pending = sum(
+            ProjectionJob.objects.using(shard).filter(status__in=[ProjectionJob.PENDING, ProjectionJob.RUNNING]).count()
+            for shard in get_shards()
+        )
+        if pending >= getattr(settings, 'PROJECTION_JOB_MAX_PENDING', 100):
+            raise QueueFull()
+
+        job = ProjectionJob.objects.using(db).create(key=key, report=report, year=year, to=to)
+
+    if getattr(settings, 'PROJECTION_JOBS_SYNC', False):
+        run_job(job.id, db)
+        job.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: get_executor().submit(run_job, job.id, db), using=db)
+    return job, True
+
+
+def run_job(job_id, using=None):
+    """
+        Computes a job and stores its result. Runs in a worker thread.
+    """
+    try:
+        jobs = ProjectionJob.objects.using(using).filter(id=job_id)
+        if not jobs.filter(status=ProjectionJob.PENDING).update(status=ProjectionJob.RUNNING, started_at=timezone.now()):
+            return
+        job = jobs.select_related('report').get()
+
+        try:
+            report = job.report
+            sources = list(Source.objects.using(report._state.db).filter(report=report))
+            snapshot = report.get_latest_snapshot()
+            list_of_emission = report.get_list_of_emission(job.year, job.to, sources, snapshot)
+            if snapshot is not None and job.year is not None and snapshot.covers(job.year):
+                delta = snapshot.deltas[str(job.year)]
+            else:
+                delta = report.get_delta(job.year, sources)
+            job.result = {
+                "Total Emission": list_of_emission[job.year],
+                "Delta": delta,
+                "List of emission": {("total" if year is None else year): value for year, value in list_of_emission.items()},
+            }
+            job.status = ProjectionJob.DONE
+        except Exception as e:
+            job.error = repr(e)
+            job.status = ProjectionJob.FAILED
+        # Not if the job was failed meanwhile (timed out, report moved): a new job may already be queued
+        jobs.filter(status=ProjectionJob.RUNNING).update(
+            result=job.result, error=job.error, status=job.status, finished_at=timezone.now()
+        )
+    finally:
+        if not getattr(settings, 'PROJECTION_JOBS_SYNC', False):
+            close_old_connections()
@@ -0,0 +1,65 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.models import Report, Source
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import ReportSerializer, SourceSerializer
+from api.sharding import shard_for_id
+from api.views import ReportDetail
+
+
+class Command(BaseCommand):
+    help = "Compare the JSON renderers (encoding time and bytes sent) on a large ReportDetail response"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', type=int, help="Render the ReportDetail response of an existing report")
+        parser.add_argument('--year', type=int, default=2020)
+        parser.add_argument('--to', type=int, default=2050)
+        parser.add_argument('--sources', type=int, default=20000, help="Number of synthetic sources when no report is given")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['report'] is not None:
+            data = self.get_report_data(options['report'], options['year'], options['to'])
+        else:
+            data = self.get_synthetic_data(options['sources'], options['year'], options['to'])
+
+        self.stdout.write("orjson installed: %s" % (orjson is not None))
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            elapsed = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                content = renderer.render(data)
+                elapsed.append(time.perf_counter() - start)
+            self.stdout.write(
+                "%-18s best %8.2f ms   %10d bytes   %10d bytes gzipped" % (
+                    type(renderer).__name__, min(elapsed) * 1000, len(content), len(gzip.compress(content))
+                )
+            )
+
+    def get_report_data(self, report_id, year, to):
+        if not Report.objects.using(shard_for_id(report_id)).filter(id=report_id).exists():
+            raise CommandError("Report %s doesn't exist" % report_id)
+        request = APIRequestFactory().get('/api/reports/%s/' % report_id, {'year': year, 'to': to})
+        return ReportDetail.as_view()(request, report_id=report_id).data
+
+    def get_synthetic_data(self, nb_sources, year, to):
+        report = Report(id=1, name="Benchmark", date="2023-01-01")
+        sources = [
+            Source(
+                id=i, report=report, description="Source %s" % i, value=i % 50, emission_factor=1.37 * (i % 7),
+                total_emission=1000.5 + i, lifetime=1 + i % 10, acquisition_year=2000 + i % 30
+            )
+            for i in range(1, nb_sources + 1)
+        ]
+        return {
+            "Report ": ReportSerializer(report).data,
+            "Sources ": SourceSerializer(sources, many=True).data,
+            "Total Emission ": 123456.789,
+            "Delta ": -42.5,
+            "List of emission ": {i: 1000.0 / (i - year + 1) for i in range(year, to + 1)},
+        }
@@ -0,0 +1,100 @@
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+from api.models import Report, Source, Modification
+from api.renderers import FastJSONRenderer
+from api.serializers import SourceSerializer, ModificationSerializer
+from api.views import SourceDetail
+
+
+def get_previous_response(source_id, year, to):
+    """
+        SourceDetail.get before the modifications were paged: the queryset is evaluated by the
+        model methods and every modification is serialized.
+    """
+    source_instance = Source.objects.filter(id=source_id).first()
+    modif_list = Modification.objects.filter(source=source_id).order_by("acquisition_year")
+    total_emission = source_instance.get_total_emissions(year, modif_list)
+    delta = source_instance.get_delta(year, modif_list)
+    list_of_emission = {year: total_emission}
+    for i in range(year+1, to+1):
+        list_of_emission[i] = source_instance.get_total_emissions(i, modif_list)
+    return {
+        "Source": SourceSerializer(source_instance).data,
+        "Modifications": ModificationSerializer(modif_list, many=True).data,
+        "Total Emission": total_emission,
+        "Delta": delta,
+        "List of emission": list_of_emission
+    }
+
+
+def get_current_response(source_id, year, to):
+    request = APIRequestFactory().get('/api/sources/%s/' % source_id, {'year': year, 'to': to})
+    return SourceDetail.as_view()(request, source_id=source_id).data
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the time and peak memory (tracemalloc) of the source detail endpoint on a source with "
+        "a large modification history, seeded in a temporary database, before and after paging."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modifications', type=int, default=100000)
+        parser.add_argument('--year', type=int, default=2020)
+        parser.add_argument('--to', type=int, default=2030)
+        parser.add_argument('--skip-previous', action='store_true', help="Only measure the current endpoint")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = '%s/bench.sqlite3' % tmp_dir
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write("Seeding a source with %s modifications..." % options['modifications'])
+                source_id = self.seed(options['modifications'])
+
+                runs = [('current', get_current_response)]
+                if not options['skip_previous']:
+                    runs.insert(0, ('previous', get_previous_response))
+                for name, get_response in runs:
+                    self.measure(name, get_response, source_id, options['year'], options['to'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, nb_modifications):
+        rng = random.Random(0)
+        report = Report.objects.create(name="Benchmark", date=date(2023, 1, 1))
+        source = Source.objects.create(
+            report=report, description="Source", value=10, emission_factor=2.0,
+            total_emission=20000, lifetime=5, acquisition_year=2000
+        )
+        Modification.objects.bulk_create((
+            Modification(
+                source=source, description="Modification %s" % i, ratio=rng.choice([0.5, 1, 2]),
+                emission_factor=rng.choice([0.5, 1.0, 3.0]), total_emission=rng.randint(0, 1000),
+                acquisition_year=date(rng.randint(2000, 2040), rng.randint(1, 12), 1), lifetime=rng.randint(1, 5)
+            )
+            for i in range(nb_modifications)
+        ), batch_size=5000)
+        return source.id
+
+    def measure(self, name, get_response, source_id, year, to):
+        # tracemalloc slows everything down, the time is measured on a separate run
+        start = time.perf_counter()
+        content = FastJSONRenderer().render(get_response(source_id, year, to))
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            FastJSONRenderer().render(get_response(source_id, year, to))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stdout.write("%-10s %9.1f ms   peak %8.1f MiB   %10d bytes" % (name, elapsed * 1000, peak / 2**20, len(content)))
@@ -0,0 +1,268 @@
+import json
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connections
+from django.test.utils import override_settings
+
+from api.models import Report, Source, Modification
+from api.sharding import get_shards
+
+ENDPOINTS = ('report_list', 'report_detail', 'source_detail', 'source_create', 'modification_create')
+DEFAULT_MIX = "report_list=1,report_detail=4,source_detail=4,source_create=1,modification_create=1"
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the API over HTTP: seeds a synthetic dataset in a temporary database, serves "
+        "the WSGI application locally and drives it with concurrent clients. Reports the "
+        "throughput and p50/p95/p99 latency of each endpoint. Use --compare to compare two runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Target an already running server instead of starting one (no seeding)")
+        parser.add_argument('--reports', type=int, default=5)
+        parser.add_argument('--sources', type=int, default=200, help="Sources per report")
+        parser.add_argument('--modifications', type=int, default=3, help="Modifications per source")
+        parser.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds of load")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help="Weights of the endpoints, default: %s" % DEFAULT_MIX)
+        parser.add_argument('--year', type=int, default=2020)
+        parser.add_argument('--to', type=int, default=2030)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Save the results to this JSON file")
+        parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help="Compare two saved runs and exit")
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'])
+
+        try:
+            mix = {name: float(weight) for name, weight in (item.split('=') for item in options['mix'].split(','))}
+        except ValueError:
+            raise CommandError("--mix must look like %s" % DEFAULT_MIX)
+        unknown = set(mix) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError("Unknown endpoints in --mix: %s" % ", ".join(sorted(unknown)))
+
+        if options['url']:
+            base_url = options['url'].rstrip('/')
+            report_ids, source_ids = self.discover(base_url)
+            results = self.run(base_url, report_ids, source_ids, mix, options)
+        else:
+            results = self.run_locally(mix, options)
+
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write("Results saved to %s" % options['output'])
+
+    def run_locally(self, mix, options):
+        """
+            Creates a temporary SQLite database for every shard, seeds them, serves the application
+            on a free port for the duration of the run and destroys the databases.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old_names = {}
+            try:
+                for alias in get_shards():
+                    connection = connections[alias]
+                    connection.settings_dict.setdefault('TEST', {})['NAME'] = '%s/loadtest_%s.sqlite3' % (tmp_dir, alias)
+                    old_names[alias] = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                self.stdout.write("Seeding %s reports x %s sources x %s modifications..." % (
+                    options['reports'], options['sources'], options['modifications']))
+                report_ids, source_ids = self.seed(options['reports'], options['sources'], options['modifications'], options['seed'])
+                for alias in old_names:
+                    connections[alias].close()
+
+                with override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1', 'localhost']):
+                    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+                    server.set_app(get_internal_wsgi_application())
+                    server.daemon_threads = True
+                    thread = threading.Thread(target=server.serve_forever, daemon=True)
+                    thread.start()
+                    try:
+                        base_url = 'http://127.0.0.1:%s' % server.server_port
+                        self.stdout.write("Serving %s on %s" % (settings.WSGI_APPLICATION, base_url))
+                        return self.run(base_url, report_ids, source_ids, mix, options)
+                    finally:
+                        server.shutdown()
+                        server.server_close()
+            finally:
+                for alias, old_name in old_names.items():
+                    connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, nb_reports, nb_sources, nb_modifications, seed):
+        """
+            The reports are created one by one so that they are spread over the shards,
+            their sources and modifications are inserted in bulk on the shard of the report.
+        """
+        rng = random.Random(seed)
+        reports = [Report.objects.create(name="Load test %s" % i, date=date(2020 + i % 4, 1, 1)) for i in range(nb_reports)]
+        source_ids = []
+        for report in reports:
+            db = report._state.db
+            sources = Source.objects.using(db).bulk_create([
+                Source(
+                    report=report, description="Source %s" % (i % 20), value=rng.randint(1, 50),
+                    emission_factor=rng.choice([0.5, 1.0, 2.0, 8.95]), total_emission=rng.randint(100, 20000),
+                    lifetime=rng.randint(1, 10), acquisition_year=rng.randint(2010, 2025)
+                )
+                for i in range(nb_sources)
+            ], batch_size=1000)
+            Modification.objects.using(db).bulk_create([
+                Modification(
+                    source=source, description="Modification %s" % i, ratio=rng.choice([0.5, 1, 2]),
+                    emission_factor=rng.choice([0.5, 1.0, 3.0]), total_emission=rng.randint(0, 1000),
+                    acquisition_year=date(source.acquisition_year + rng.randint(0, 8), rng.randint(1, 12), 1),
+                    lifetime=rng.randint(1, 5)
+                )
+                for source in sources for i in range(nb_modifications)
+            ], batch_size=1000)
+            source_ids += [source.id for source in sources]
+        return [report.id for report in reports], source_ids
+
+    def discover(self, base_url):
+        with urllib.request.urlopen(base_url + '/api/reports/') as response:
+            report_ids = [report['id'] for report in json.load(response)["Reports : "]]
+        if not report_ids:
+            raise CommandError("No report on %s" % base_url)
+        with urllib.request.urlopen(base_url + '/api/sources/?report=%s' % report_ids[0]) as response:
+            source_ids = [source['id'] for source in json.load(response)["Sources "]]
+        if not source_ids:
+            raise CommandError("No source in report %s on %s" % (report_ids[0], base_url))
+        return report_ids, source_ids
+
+    def get_requests(self, base_url, rng, report_ids, source_ids, year, to):
+        """
+            Builders of the requests of each endpoint of the mix: name -> () -> (method, url, body)
+        """
+        return {
+            'report_list': lambda: ('GET', '%s/api/reports/' % base_url, None),
+            'report_detail': lambda: ('GET', '%s/api/reports/%s/?year=%s&to=%s' % (base_url, rng.choice(report_ids), year, to), None),
+            'source_detail': lambda: ('GET', '%s/api/sources/%s/?year=%s&to=%s' % (base_url, rng.choice(source_ids), year, to), None),
+            'source_create': lambda: ('POST', '%s/api/sources/' % base_url, {
+                "report": rng.choice(report_ids), "description": "Load test", "value": 1, "emission_factor": 2.0,
+                "total_emission": 1000, "lifetime": 5, "acquisition_year": 2000,
+            }),
+            'modification_create': lambda: ('POST', '%s/api/sources/%s/' % (base_url, rng.choice(source_ids)), {
+                "description": "Load test", "ratio": 1.5, "emission_factor": 1.0, "total_emission": 50,
+                "acquisition_year": "2030-06-01", "lifetime": 2,
+            }),
+        }
+
+    def run(self, base_url, report_ids, source_ids, mix, options):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def client(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            requests = self.get_requests(base_url, rng, report_ids, source_ids, options['year'], options['to'])
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                method, url, body = requests[name]()
+                data = json.dumps(body).encode() if body is not None else None
+                request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        response.read()
+                    failed = False
+                except (urllib.error.URLError, ConnectionError):
+                    failed = True
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[name].append(elapsed)
+                    if failed:
+                        errors[name] += 1
+
+        self.stdout.write("Running %s clients for %ss..." % (options['clients'], options['duration']))
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(options['clients'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - start
+
+        endpoints = {}
+        for name in names:
+            values = sorted(latencies[name])
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": errors[name],
+                "throughput": len(values) / wall_time,
+                "mean_ms": sum(values) / len(values) * 1000 if values else None,
+                "p50_ms": percentile(values, 50) * 1000 if values else None,
+                "p95_ms": percentile(values, 95) * 1000 if values else None,
+                "p99_ms": percentile(values, 99) * 1000 if values else None,
+            }
+        return {
+            "clients": options['clients'],
+            "duration": wall_time,
+            "requests": sum(endpoint["requests"] for endpoint in endpoints.values()),
+            "throughput": sum(endpoint["requests"] for endpoint in endpoints.values()) / wall_time,
+            "endpoints": endpoints,
+        }
+
+    def print_results(self, results):
+        self.stdout.write("%-20s %9s %7s %9s %9s %9s %9s" % ("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+        for name, endpoint in results["endpoints"].items():
+            if not endpoint["requests"]:
+                continue
+            self.stdout.write("%-20s %9d %7d %9.1f %9.1f %9.1f %9.1f" % (
+                name, endpoint["requests"], endpoint["errors"], endpoint["throughput"],
+                endpoint["p50_ms"], endpoint["p95_ms"], endpoint["p99_ms"],
+            ))
+        self.stdout.write("Total: %d requests in %.1fs, %.1f req/s" % (results["requests"], results["duration"], results["throughput"]))
+
+    def compare(self, baseline_path, candidate_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        with open(candidate_path) as f:
+            candidate = json.load(f)
+
+        def change(before, after):
+            if not before or after is None:
+                return "      n/a"
+            return "%+8.1f%%" % ((after - before) / before * 100)
+
+        self.stdout.write("%-20s %9s %9s %9s %9s" % ("endpoint", "req/s", "p50", "p95", "p99"))
+        for name in baseline["endpoints"]:
+            if name not in candidate["endpoints"]:
+                continue
+            before, after = baseline["endpoints"][name], candidate["endpoints"][name]
+            self.stdout.write("%-20s %9s %9s %9s %9s" % (
+                name,
+                change(before["throughput"], after["throughput"]),
+                change(before["p50_ms"], after["p50_ms"]),
+                change(before["p95_ms"], after["p95_ms"]),
+                change(before["p99_ms"], after["p99_ms"]),
+            ))
+        self.stdout.write("%-20s %9s" % ("total", change(baseline["throughput"], candidate["throughput"])))
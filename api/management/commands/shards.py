@@ -0,0 +1,108 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api.models import Modification, Report, ReportMove, Source
+from api.sharding import get_shards, move_report, resume_moves, shard_for_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the report shards. "
+        "init: migrate every shard (its ids start at its range after the migration). "
+        "status: number of reports, sources and modifications by shard. "
+        "move: move a report to a shard, the report gets a new id. "
+        "resume: finish the moves that stopped before the end. "
+        "rebalance: move reports from the most loaded shards to the least loaded ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['init', 'status', 'move', 'resume', 'rebalance'])
+        parser.add_argument('--report', type=int, help="Report to move")
+        parser.add_argument('--to', help="Shard to move the report to")
+        parser.add_argument('--max-moves', type=int, default=100)
+        parser.add_argument('--dry-run', action='store_true', help="Print the moves of the rebalance without doing them")
+
+    def handle(self, *args, **options):
+        getattr(self, options['action'])(options)
+
+    def init(self, options):
+        for shard in get_shards():
+            self.stdout.write("Migrating %s" % shard)
+            call_command('migrate', database=shard, verbosity=0)
+        self.status(options)
+
+    def status(self, options):
+        self.stdout.write("%-12s %10s %10s %14s" % ("shard", "reports", "sources", "modifications"))
+        for shard in get_shards():
+            self.stdout.write("%-12s %10d %10d %14d" % (
+                shard,
+                Report.objects.using(shard).count(),
+                Source.objects.using(shard).count(),
+                Modification.objects.using(shard).count(),
+            ))
+        unfinished = ReportMove.objects.filter(finished_at__isnull=True).count()
+        if unfinished:
+            self.stdout.write("%s moves did not finish, run: shards resume" % unfinished)
+
+    def move(self, options):
+        if options['report'] is None or options['to'] not in get_shards():
+            raise CommandError("move needs --report and --to, one of: %s" % ", ".join(get_shards()))
+        report = Report.objects.using(shard_for_id(options['report'])).filter(id=options['report']).first()
+        if report is None:
+            raise CommandError("Report %s doesn't exist" % options['report'])
+        if report._state.db == options['to']:
+            raise CommandError("Report %s is already on %s" % (report.id, options['to']))
+        new_report = move_report(report, options['to'])
+        self.stdout.write(
+            "Report %s moved to %s, its new id is %s (the old id answers with a redirect to it)"
+            % (options['report'], options['to'], new_report.id)
+        )
+
+    def resume(self, options):
+        moves = resume_moves()
+        for move in moves:
+            self.stdout.write("Report %s moved to %s, its new id is %s" % (move.report_id, move.to_shard, move.new_report_id))
+        self.stdout.write("%s moves finished" % len(moves))
+
+    def rebalance(self, options):
+        """
+            The load of a report is its number of sources. Repeatedly moves, from the most loaded
+            shard to the least loaded one, the biggest report that narrows the gap between them.
+        """
+        shards = get_shards()
+        if len(shards) < 2:
+            raise CommandError("There is only one shard")
+        if ReportMove.objects.filter(finished_at__isnull=True).exists():
+            raise CommandError("Some moves did not finish, run: shards resume")
+
+        reports = {
+            shard: dict(Report.objects.using(shard).annotate(load=Count('source')).values_list('id', 'load'))
+            for shard in shards
+        }
+        loads = {shard: sum(reports[shard].values()) for shard in shards}
+
+        for _ in range(options['max_moves']):
+            heaviest = max(shards, key=lambda shard: loads[shard])
+            lightest = min(shards, key=lambda shard: loads[shard])
+            gap = loads[heaviest] - loads[lightest]
+            candidates = [(load, report_id) for report_id, load in reports[heaviest].items() if 0 < load <= gap / 2]
+            if not candidates:
+                break
+            load, report_id = max(candidates)
+
+            if options['dry_run']:
+                self.stdout.write("Would move report %s (%s sources) from %s to %s" % (report_id, load, heaviest, lightest))
+                new_id = report_id
+            else:
+                report = Report.objects.using(heaviest).get(id=report_id)
+                new_id = move_report(report, lightest).id
+                self.stdout.write("Moved report %s (%s sources) from %s to %s, new id %s" % (report_id, load, heaviest, lightest, new_id))
+
+            del reports[heaviest][report_id]
+            reports[lightest][new_id] = load
+            loads[heaviest] -= load
+            loads[lightest] += load
+
+        if not options['dry_run']:
+            self.status(options)
@@ -0,0 +1,85 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.test.utils import CaptureQueriesContext
+
+from .sharding import get_shards
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """
+        Gzip the response when the client sends `Accept-Encoding: gzip` and the body is
+        at least `GZIP_MIN_LENGTH` bytes. Small responses are not worth the CPU.
+    """
+
+    def process_response(self, request, response):
+        min_length = getattr(settings, 'GZIP_MIN_LENGTH', 1024)
+        if not response.streaming and len(response.content) < min_length:
+            return response
+        return super().process_response(request, response)
+
+
+class ProfilingMiddleware:
+    """
+        Runs the request under cProfile when `?profile=` or the `X-Profile` header is given,
+        and returns the sorted call statistics and the SQL queries of every shard instead of the response.
+        The value is the pstats sort key (cumulative by default).
+        Only available in DEBUG or to staff users. When PROFILE_DIR is set, the raw
+        profile is also stored there, to be opened with pstats or snakeviz.
+    """
+    SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'calls', 'time', 'filename', 'name')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sort_key = request.GET.get('profile', request.META.get('HTTP_X_PROFILE'))
+        if sort_key is None or not self.is_allowed(request):
+            return self.get_response(request)
+
+        if sort_key not in self.SORT_KEYS:
+            sort_key = 'cumulative'
+
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            captures = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in get_shards()}
+            response = profiler.runcall(self.get_response, request)
+        queries = [
+            dict(query, database=alias) for alias, capture in captures.items() for query in capture.captured_queries
+        ]
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(sort_key).print_stats(getattr(settings, 'PROFILE_LINES', 50))
+
+        data = {
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "total_time": stats.total_tt,
+            "profile": stream.getvalue(),
+            "queries_count": len(queries),
+            "queries": queries,
+        }
+
+        profile_dir = getattr(settings, 'PROFILE_DIR', None)
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            filename = "%s-%s.prof" % (time.strftime('%Y%m%d-%H%M%S'), request.path.strip('/').replace('/', '_') or 'root')
+            stats.dump_stats(os.path.join(profile_dir, filename))
+            data["file"] = os.path.join(profile_dir, filename)
+
+        return JsonResponse(data)
+
+    def is_allowed(self, request):
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_authenticated and user.is_staff
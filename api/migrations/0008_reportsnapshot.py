@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:52
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_projectionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('to', models.PositiveSmallIntegerField()),
+                ('total_emission', models.FloatField()),
+                ('delta', models.FloatField()),
+                ('totals', models.JSONField(help_text='Total emissions by year')),
+                ('deltas', models.JSONField(help_text='Delta by year')),
+                ('inputs', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Sources and modifications of the report')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.report')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_changelogentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='modification',
+            name='description',
+            field=models.CharField(blank=True, db_index=True, max_length=250, null=True),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='name',
+            field=models.CharField(blank=True, db_index=True, max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='acquisition_year',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='description',
+            field=models.CharField(blank=True, db_index=True, max_length=250, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changelogentry',
+            name='report_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+# The admin searches with istartswith ('^' in search_fields), which compiles to
+# `col LIKE 'x%'` on SQLite (case-insensitive) and `UPPER(col) LIKE UPPER('x%')` on PostgreSQL.
+# A plain index on the column is used by neither: SQLite needs a NOCASE index and PostgreSQL an
+# index on UPPER(col) with the pattern operator class.
+SEARCH_INDEXES = [
+    ('api_report_name_search', 'api_report', 'name'),
+    ('api_source_description_search', 'api_source', 'description'),
+    ('api_modification_description_search', 'api_modification', 'description'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    for index, table, column in SEARCH_INDEXES:
+        if schema_editor.connection.vendor == 'sqlite':
+            expression = '%s COLLATE NOCASE' % quote_name(column)
+        elif schema_editor.connection.vendor == 'postgresql':
+            expression = 'UPPER(%s) varchar_pattern_ops' % quote_name(column)
+        else:
+            continue
+        schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (quote_name(index), quote_name(table), expression))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        for index, table, column in SEARCH_INDEXES:
+            schema_editor.execute('DROP INDEX IF EXISTS %s' % schema_editor.quote_name(index))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_changelogentry_report_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='modification',
+            name='description',
+            field=models.CharField(blank=True, max_length=250, null=True),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='name',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='description',
+            field=models.CharField(blank=True, max_length=250, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
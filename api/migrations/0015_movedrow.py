@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_projectionjob_started_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('old_id', models.BigIntegerField(db_index=True)),
+                ('new_id', models.BigIntegerField()),
+                ('move', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.reportmove')),
+            ],
+        ),
+    ]
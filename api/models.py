@@ -1,5 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from datetime import datetime
+import uuid
 
 class Report(models.Model): 
     """
@@ -14,7 +16,7 @@ class Report(models.Model):
     date = models.DateField()
 
     def __str__(self):
-        return self.name
+        return self.name or "Report %s" % self.id
     
     def get_total_emissions(self, year=None, sources_list=None):
         """
@@ -25,7 +27,7 @@ class Report(models.Model):
         """
         total_emissions = 0
         source_ids = [source.id for source in sources_list]
-        modif_list = Modification.objects.filter(source__in=source_ids).order_by("acquisition_year")
+        modif_list = Modification.objects.using(self._state.db).filter(source__in=source_ids).order_by("acquisition_year")
         for source in sources_list:
             #modif_list = Modification.objects.filter(source=source).order_by("acquisition_year")
             total_emissions += source.get_total_emissions(year=year, modif_list=modif_list.filter(source=source))
@@ -38,7 +40,7 @@ class Report(models.Model):
         """
         total_delta = 0
         source_ids = [source.id for source in sources_list]
-        modif_list = Modification.objects.filter(source__in=source_ids)
+        modif_list = Modification.objects.using(self._state.db).filter(source__in=source_ids)
         for source in sources_list:
             #modif_list = Modification.objects.filter(source=source)
             filtered_modif_list=modif_list.filter(source=source).order_by("acquisition_year")
@@ -46,6 +48,30 @@ class Report(models.Model):
             total_delta += delta
         return total_delta
 
+    def get_latest_snapshot(self):
+        """
+            Returns the most recent snapshot of this report, or None.
+        """
+        return self.reportsnapshot_set.order_by('-created_at', '-id').first()
+
+    def get_list_of_emission(self, year=None, to=None, sources_list=None, snapshot=None):
+        """
+            Get the total emissions of this report for every year from `year` to `to` (included).
+            Without `to`, only `year` is computed.
+            The years stored in `snapshot` are read from it instead of being recomputed.
+        """
+        years = [year]
+        if year is not None and to is not None and to > year:
+            years += list(range(year+1, to+1))
+
+        list_of_emission = {}
+        for i in years:
+            if snapshot is not None and i is not None and snapshot.covers(i):
+                list_of_emission[i] = snapshot.totals[str(i)]
+            else:
+                list_of_emission[i] = self.get_total_emissions(i, sources_list)
+        return list_of_emission
+
 class Source(models.Model): 
     """
         An Emission is every source that generates GreenHouse gases (GHG).
@@ -66,10 +92,10 @@ class Source(models.Model):
     emission_factor = models.FloatField(blank=True, null=True)
     total_emission = models.FloatField(blank=True, null=True, help_text="Unit in kg")
     lifetime = models.PositiveIntegerField(blank=True, null=True)
-    acquisition_year = models.PositiveSmallIntegerField(blank=True, null=True)
+    acquisition_year = models.PositiveSmallIntegerField(blank=True, null=True, db_index=True)
 
     def __str__(self):
-        return self.description
+        return self.description or "Source %s" % self.id
     
     def get_total_emissions(self, year=None, modif_list=None):
         """
@@ -137,12 +163,12 @@ class Source(models.Model):
             if len(modif_list)>1:
                 before_last_modif = modif_list[len(modif_list)-2]
                 usage_emission_delta = (last_modif.emission_factor * (last_modif.ratio * self.value)) - (before_last_modif.emission_factor * (before_last_modif.ratio * self.value))
-                amortissement_delta = last_modif.total_emission / last_modif.lifetime
+                amortissement_delta = last_modif.total_emission / last_modif.lifetime if last_modif.lifetime else 0
                 delta = amortissement_delta + usage_emission_delta
                 return delta
             else:
                 usage_emission_delta = (last_modif.emission_factor * (last_modif.ratio * self.value)) - (self.emission_factor * self.value)
-                amortissement_delta = last_modif.total_emission / last_modif.lifetime
+                amortissement_delta = last_modif.total_emission / last_modif.lifetime if last_modif.lifetime else 0
                 delta = amortissement_delta + usage_emission_delta
                 return delta
         else:
@@ -155,12 +181,12 @@ class Source(models.Model):
             if len(modifs_with_year)>1:
                 before_last_modif = modifs_with_year[len(modifs_with_year)-2]
                 usage_emission_delta = (last_modif.emission_factor * (last_modif.ratio * self.value)) - (before_last_modif.emission_factor * (before_last_modif.ratio * self.value))
-                amortissement_delta = last_modif.total_emission / last_modif.lifetime
+                amortissement_delta = last_modif.total_emission / last_modif.lifetime if last_modif.lifetime else 0
                 delta = amortissement_delta + usage_emission_delta if not_amortized else usage_emission_delta
                 return delta
             else:
                 usage_emission_delta = (last_modif.emission_factor * (last_modif.ratio * self.value)) - (self.emission_factor * self.value)
-                amortissement_delta = last_modif.total_emission / last_modif.lifetime
+                amortissement_delta = last_modif.total_emission / last_modif.lifetime if last_modif.lifetime else 0
                 delta = amortissement_delta + usage_emission_delta if not_amortized else usage_emission_delta
                 return delta
 
@@ -189,4 +215,111 @@ class Modification(models.Model):
             elif years_since_acquisition >= self.lifetime:
                 return 0
             else:
-                return (self.total_emission / self.lifetime)
\ No newline at end of file
+                return (self.total_emission / self.lifetime)
+
+class ProjectionJob(models.Model):
+    """
+        An asynchronous computation of a report projection over `year..to`.
+        Jobs with the same parameters share the same `key`, so identical requests are deduplicated.
+        The result is stored in `result` until the job expires (see PROJECTION_JOB_TTL).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    key = models.CharField(max_length=64, db_index=True)
+    report = models.ForeignKey(Report, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField(blank=True, null=True)
+    to = models.PositiveSmallIntegerField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "%s (%s)" % (self.id, self.status)
+
+
+class ReportSnapshot(models.Model):
+    """
+        An immutable copy of the computed yearly totals and deltas of a report, with the
+        sources and modifications they were computed from.
+        Years stored in a snapshot are served from it instead of being recomputed.
+    """
+    report = models.ForeignKey(Report, on_delete=models.CASCADE)
+    name = models.CharField(max_length=200, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    year = models.PositiveSmallIntegerField()
+    to = models.PositiveSmallIntegerField()
+    total_emission = models.FloatField()
+    delta = models.FloatField()
+    totals = models.JSONField(help_text="Total emissions by year")
+    deltas = models.JSONField(help_text="Delta by year")
+    inputs = models.JSONField(encoder=DjangoJSONEncoder, help_text="Sources and modifications of the report")
+
+    def __str__(self):
+        return self.name or "Snapshot %s of report %s" % (self.id, self.report_id)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("A report snapshot cannot be modified")
+        super().save(*args, **kwargs)
+
+    def covers(self, year):
+        return str(year) in self.totals
+
+
+class ChangeLogEntry(models.Model):
+    """
+        A create or a delete of a Report, Source or Modification.
+        The id is the cursor of the change feed: entries are only appended, so a consumer
+        asks for the changes after the last id it has seen.
+    """
+    CREATE = 'create'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(CREATE, 'Create'), (DELETE, 'Delete')]
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    report_id = models.BigIntegerField(blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "%s %s %s" % (self.action, self.model, self.object_id)
+
+
+class ReportMove(models.Model):
+    """
+        A move of a report to another shard (see sharding.move_report). The shard is encoded in the
+        ids, so the moved report gets a new id: `new_report_id` is where `report_id` went.
+        A move is finished once the report has been deleted from its old shard, until then the
+        copy on `to_shard` is hidden and is reused or removed when the move is run again.
+    """
+    report_id = models.BigIntegerField(db_index=True)
+    from_shard = models.CharField(max_length=100)
+    to_shard = models.CharField(max_length=100)
+    new_report_id = models.BigIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "Report %s moved to %s (%s)" % (self.report_id, self.to_shard, self.new_report_id)
+
+
+class MovedRow(models.Model):
+    """
+        The new id of a source, modification or snapshot copied by a ReportMove.
+    """
+    move = models.ForeignKey(ReportMove, on_delete=models.CASCADE)
+    model = models.CharField(max_length=20)
+    old_id = models.BigIntegerField(db_index=True)
+    new_id = models.BigIntegerField()
+
+    def __str__(self):
+        return "%s %s moved to %s" % (self.model, self.old_id, self.new_id)
@@ -0,0 +1,29 @@
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+        JSON renderer backed by orjson when it is installed.
+
+        orjson encodes floats, dates and dicts with integer keys (our "List of emission")
+        natively and is several times faster than the stdlib. Values orjson does not know
+        (Decimal, lazy strings, ...) go through DRF's encoder. When orjson is missing, or an
+        indented output is requested, we fall back to the default DRF renderer.
+    """
+    orjson_options = 0 if orjson is None else orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(data, default=JSONEncoder().default, option=self.orjson_options)
@@ -0,0 +1,88 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .changes import record_changes
+from .models import ChangeLogEntry, Modification, Report, Source
+
+SOURCE_FIELDS = ('description', 'value', 'emission_factor', 'total_emission', 'lifetime', 'acquisition_year')
+MODIFICATION_FIELDS = ('description', 'ratio', 'emission_factor', 'total_emission', 'acquisition_year', 'lifetime')
+
+
+def check_overrides(overrides, fields):
+    """
+        Returns the fields of `overrides` that cannot be overridden.
+    """
+    return sorted(set(overrides or {}) - set(fields))
+
+
+def rollover_report(
+    report, date, name=None, source_overrides=None, modification_overrides=None, using=None, batch_size=2000,
+    source_ids=None, modification_ids=None,
+):
+    """
+        Clones `report` with all its sources and modifications into a new report dated `date`.
+
+        Everything is done in one transaction with batched inserts: the sources are read and
+        inserted by batches, the new ids are kept in memory to remap the modifications.
+        The bulk inserts do not send signals, so the change log is written here, in a transaction
+        on the default database (where the change log is) rolled back with the one of the shard.
+        `source_overrides` and `modification_overrides` are values set on every clone.
+        The new report is created on the shard `using`, the shard of `report` by default.
+        `source_ids` and `modification_ids`, when given, are filled with the old id -> new id of the clones.
+        Returns the new report, the number of sources and of modifications cloned.
+    """
+    source_overrides = source_overrides or {}
+    modification_overrides = modification_overrides or {}
+
+    db = report._state.db
+    using = using or db
+
+    with transaction.atomic(using=using), transaction.atomic(using=DEFAULT_DB_ALIAS):
+        new_report = Report.objects.using(using).create(name=name if name is not None else report.name, date=date)
+
+        source_ids = {} if source_ids is None else source_ids
+        modification_ids = {} if modification_ids is None else modification_ids
+        old_ids = []
+        batch = []
+
+        def insert_sources():
+            created = Source.objects.using(using).bulk_create(batch)
+            record_changes(Source, created, ChangeLogEntry.CREATE, new_report.id)
+            for old_id, source in zip(old_ids, created):
+                source_ids[old_id] = source.id
+            old_ids.clear()
+            batch.clear()
+
+        rows = Source.objects.using(db).filter(report=report).order_by('id').values('id', *SOURCE_FIELDS)
+        for row in rows.iterator(chunk_size=batch_size):
+            old_ids.append(row.pop('id'))
+            row.update(source_overrides)
+            batch.append(Source(report=new_report, **row))
+            if len(batch) >= batch_size:
+                insert_sources()
+        if batch:
+            insert_sources()
+
+        nb_modifications = 0
+
+        def insert_modifications():
+            nonlocal nb_modifications
+            created = Modification.objects.using(using).bulk_create(batch)
+            record_changes(Modification, created, ChangeLogEntry.CREATE, new_report.id)
+            nb_modifications += len(created)
+            for old_id, modif in zip(old_ids, created):
+                modification_ids[old_id] = modif.id
+            old_ids.clear()
+            batch.clear()
+
+        rows = Modification.objects.using(db).filter(source__report=report).order_by('id').values('id', 'source_id', *MODIFICATION_FIELDS)
+        for row in rows.iterator(chunk_size=batch_size):
+            old_ids.append(row.pop('id'))
+            row['source_id'] = source_ids[row['source_id']]
+            row.update(modification_overrides)
+            batch.append(Modification(**row))
+            if len(batch) >= batch_size:
+                insert_modifications()
+        if batch:
+            insert_modifications()
+
+    return new_report, len(source_ids), nb_modifications
@@ -0,0 +1,132 @@
+from collections import defaultdict
+
+from django.db.models import CharField, F, FloatField, Sum
+from django.db.models.functions import Cast, NullIf
+
+from . import emissions
+from .models import Modification, Report, Source
+
+GROUP_BY_FIELDS = {
+    'description': 'description',
+    'report': 'report_id',
+    'acquisition_year': 'acquisition_year',
+}
+
+
+def get_rollup(reports, group_by='description', year=None, to=None, keys=None, using=None):
+    """
+        Sums the emissions of the sources of `reports`, grouped by `group_by`.
+
+        Returns {key: {year: total}} for every year from `year` to `to`, or {key: {"total": total}}
+        when no year is given. `keys` restricts the groups returned. `using` is the shard of the reports.
+
+        The amortization and the initial usage of the sources only depend on their acquisition year
+        and lifetime, so they are summed by the database. The modifications are streamed in one
+        query, ordered by source and date, as plain tuples: each one adds its amortization and
+        changes the usage of its source from its year on, a step in the difference array.
+        The sources and modifications missing a value the projection needs are left out.
+    """
+    field = GROUP_BY_FIELDS[group_by]
+    source_field = 'source__' + field
+    sources_queryset = Source.objects.using(using).filter(report__in=reports)
+    modifications = Modification.objects.using(using).filter(source__report__in=reports)
+    if keys:
+        sources_queryset = sources_queryset.filter(**{field + '__in': keys})
+        modifications = modifications.filter(**{source_field + '__in': keys})
+
+    if year is None:
+        totals = defaultdict(float)
+        sources_queryset = sources_queryset.filter(total_emission__isnull=False)
+        for group in sources_queryset.values(field).annotate(total=Sum('total_emission')).order_by():
+            totals[group[field]] += group['total']
+        modifications = modifications.filter(total_emission__isnull=False)
+        for group in modifications.values(source_field).annotate(total=Sum('total_emission')).order_by():
+            totals[group[source_field]] += group['total']
+        return {key: {"total": total} for key, total in totals.items()}
+
+    sources_queryset = sources_queryset.filter(acquisition_year__isnull=False, value__isnull=False, emission_factor__isnull=False)
+    modifications = modifications.filter(
+        source__acquisition_year__isnull=False, source__value__isnull=False, source__emission_factor__isnull=False,
+        acquisition_year__isnull=False, emission_factor__isnull=False,
+    )
+
+    to = year if to is None or to < year else to
+    diffs = defaultdict(lambda: [0.0] * (to - year + 2))
+    grouped_sources = (
+        sources_queryset
+        .values(field, 'acquisition_year', 'lifetime')
+        .annotate(
+            amortization=Sum(F('total_emission') / NullIf(F('lifetime'), 0), output_field=FloatField()),
+            usage=Sum(F('emission_factor') * F('value'), output_field=FloatField()),
+        )
+        .order_by()
+    )
+    for group in grouped_sources:
+        diff = diffs[group[field]]
+        acquisition_year = group['acquisition_year']
+        if group['lifetime'] and group['amortization'] is not None:
+            emissions.add_range(diff, year, to, acquisition_year, acquisition_year + group['lifetime'], group['amortization'])
+        emissions.add_range(diff, year, to, acquisition_year, to + 1, group['usage'])
+
+    # The dates are read as ISO strings: they sort the same way and skip the date conversion of every row
+    rows = (
+        modifications
+        .order_by('source_id', 'acquisition_year', 'id')
+        .values_list(
+            source_field, 'source_id', 'source__acquisition_year', 'source__value', 'source__emission_factor',
+            Cast('acquisition_year', CharField()), 'ratio', 'emission_factor', 'total_emission', 'lifetime',
+        )
+        .iterator(chunk_size=10000)
+    )
+    # add_range is inlined in this loop, it runs once or twice per modification
+    current_source = None
+    for key, source_id, acquisition_year, value, source_factor, modif_date, ratio, factor, total, lifetime in rows:
+        diff = diffs[key]
+        modif_year = int(modif_date[:4])
+        first = max(modif_year, acquisition_year, year)
+        if lifetime and total is not None:
+            last = min(modif_year + lifetime, to + 1)
+            if first < last:
+                amortization = total / lifetime
+                diff[first - year] += amortization
+                diff[last - year] -= amortization
+
+        # Same rule as emissions.add_source_emissions: the first modification of a date drives the usage
+        if source_id != current_source:
+            current_source, closest_date, usage = source_id, None, source_factor * value
+        if modif_date != closest_date:
+            closest_date = modif_date
+            modif_usage = factor * (ratio * value)
+            if first <= to:
+                diff[first - year] += modif_usage - usage
+            usage = modif_usage
+
+    return {key: emissions.integrate(diff, year, to) for key, diff in diffs.items()}
+
+
+def filter_reports(report_ids=None, date_from=None, date_to=None, using=None, exclude_ids=None):
+    reports = Report.objects.using(using).all()
+    if exclude_ids:
+        reports = reports.exclude(id__in=exclude_ids)
+    if report_ids:
+        reports = reports.filter(id__in=report_ids)
+    if date_from is not None:
+        reports = reports.filter(date__gte=date_from)
+    if date_to is not None:
+        reports = reports.filter(date__lte=date_to)
+    return reports.values('id')
+
+
+def merge_rollups(rollups):
+    """
+        Sums the rollups computed on each shard.
+    """
+    merged = {}
+    for rollup in rollups:
+        for key, series in rollup.items():
+            if key not in merged:
+                merged[key] = dict(series)
+            else:
+                for year, value in series.items():
+                    merged[key][year] += value
+    return merged
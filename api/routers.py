@@ -0,0 +1,61 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import get_shards, shard_for_id, shard_for_new_report
+
+SHARDED_MODELS = ('report', 'source', 'modification', 'reportsnapshot', 'projectionjob')
+
+
+class ReportShardRouter:
+    """
+        Sends each report, and the rows attached to it, to the shard encoded in its id.
+
+        Routing needs an instance: querysets without hints go to the default database, so the
+        views select the shard with `.using(shard_for_id(...))`. Every other model (change log,
+        auth, sessions, admin, ...) lives on the default database.
+    """
+
+    def get_shard(self, model, instance):
+        if instance._state.db is not None:
+            return instance._state.db
+        model_name = model._meta.model_name
+        if model_name == 'report':
+            return shard_for_id(instance.pk) if instance.pk is not None else shard_for_new_report()
+        if model_name == 'source':
+            return shard_for_id(instance.report_id) if instance.report_id is not None else DEFAULT_DB_ALIAS
+        if model_name == 'modification':
+            return shard_for_id(instance.source_id)
+        return shard_for_id(instance.report_id)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'api':
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'api':
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and isinstance(instance, model):
+            return self.get_shard(model, instance)
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db is not None and obj2._state.db is not None:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        if db in get_shards():
+            return app_label == 'api' and (model_name is None or model_name in SHARDED_MODELS)
+        return None
@@ -1,18 +1,63 @@
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
-from .models import Report, Source, Modification
+from .models import Report, Source, Modification, ProjectionJob, ReportSnapshot, ChangeLogEntry
+from .sharding import shard_for_id
 
-class ReportSerializer(serializers.ModelSerializer):
+class ShardedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+        Looks the related report or source up on the shard given by its id.
+    """
+    def to_internal_value(self, data):
+        try:
+            return self.get_queryset().using(shard_for_id(data)).get(pk=data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class ShardedModelSerializer(serializers.ModelSerializer):
+    """
+        Saves new instances through the database router, which picks their shard
+        (QuerySet.create would always write to the default database).
+    """
+    def create(self, validated_data):
+        instance = self.Meta.model(**validated_data)
+        instance.save()
+        return instance
+
+class ReportSerializer(ShardedModelSerializer):
     class Meta:
         model = Report
         fields = ('__all__')
 
 
-class SourceSerializer(serializers.ModelSerializer):
+class SourceSerializer(ShardedModelSerializer):
+    report = ShardedPrimaryKeyRelatedField(queryset=Report.objects.all(), required=False, allow_null=True)
+
     class Meta:
         model = Source
         fields = ('__all__')
 
-class ModificationSerializer(serializers.ModelSerializer):
+class ModificationSerializer(ShardedModelSerializer):
+    source = ShardedPrimaryKeyRelatedField(queryset=Source.objects.all())
+
     class Meta:
         model = Modification
-        fields = ('__all__')
\ No newline at end of file
+        fields = ('__all__')
+
+class ProjectionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProjectionJob
+        exclude = ('key',)
+
+
+class ReportSnapshotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportSnapshot
+        exclude = ('inputs',)
+
+
+class ChangeLogEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChangeLogEntry
+        fields = ('__all__')
@@ -0,0 +1,265 @@
+"""
+    Reports are split across the databases listed in REPORT_SHARDS.
+
+    Every report lives with its sources, modifications, snapshots and jobs on one shard.
+    The shard is encoded in the ids: the ids of the i-th shard start at i * SHARD_ID_SPAN
+    (see `initialize_sequences`), so the shard of a report, a source, a modification or a
+    snapshot is known from its id alone, without any lookup.
+"""
+import itertools
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+SHARDED_TABLES = ('api_report', 'api_source', 'api_modification', 'api_reportsnapshot')
+# Databases whose id sequences initialize_sequences can move
+SUPPORTED_VENDORS = ('sqlite', 'postgresql')
+
+_next_shard = itertools.count()
+_next_shard_lock = threading.Lock()
+
+
+def get_shards():
+    return getattr(settings, 'REPORT_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def get_id_span():
+    return getattr(settings, 'SHARD_ID_SPAN', 10**12)
+
+
+def shard_for_id(pk):
+    """
+        Returns the database of the report, source, modification or snapshot with this id.
+    """
+    shards = get_shards()
+    try:
+        index = int(pk) // get_id_span()
+    except (TypeError, ValueError):
+        return shards[0]
+    return shards[index] if 0 <= index < len(shards) else shards[0]
+
+
+def shard_for_new_report():
+    """
+        Returns the database of a new report, the shards are used in turn.
+        The rebalance command evens them out afterwards if needed.
+    """
+    shards = get_shards()
+    with _next_shard_lock:
+        return shards[next(_next_shard) % len(shards)]
+
+
+def group_ids_by_shard(ids):
+    shard_ids = {}
+    for pk in ids:
+        shard_ids.setdefault(shard_for_id(pk), []).append(pk)
+    return shard_ids
+
+
+def check_shards():
+    """
+        Raises ImproperlyConfigured when REPORT_SHARDS lists an unknown database, or a database
+        whose ids cannot be started at its range. Called when the app is loaded.
+    """
+    shards = get_shards()
+    for alias in shards:
+        if alias not in connections:
+            raise ImproperlyConfigured("REPORT_SHARDS: %s is not in DATABASES" % alias)
+        if len(shards) > 1 and connections[alias].vendor not in SUPPORTED_VENDORS:
+            raise ImproperlyConfigured(
+                "REPORT_SHARDS: sharding is not supported on %s (%s), only on %s"
+                % (alias, connections[alias].vendor, ", ".join(SUPPORTED_VENDORS))
+            )
+
+
+def initialize_sequences(alias):
+    """
+        Starts the ids of the sharded tables of `alias` at its id range.
+        Does nothing if the ids are already past the start of the range.
+    """
+    start = get_shards().index(alias) * get_id_span()
+    if start == 0:
+        return
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for table in SHARDED_TABLES:
+            if connection.vendor == 'sqlite':
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [start, table, start])
+                cursor.execute("SELECT COUNT(*) FROM sqlite_sequence WHERE name = %s", [table])
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {})))".format(table),
+                    [table, start]
+                )
+
+
+def initialize_shard(sender, using, **kwargs):
+    """
+        post_migrate receiver: the ids of a shard start at its range as soon as it is migrated.
+    """
+    if using in get_shards():
+        initialize_sequences(using)
+
+
+def get_moving_copies():
+    """
+        Returns the ids of the copies made by the moves not finished yet: the report still exists
+        on its old shard, the copy must not be listed too.
+    """
+    from .models import ReportMove
+
+    return set(
+        ReportMove.objects.filter(finished_at__isnull=True, new_report_id__isnull=False).values_list('new_report_id', flat=True)
+    )
+
+
+def remap_inputs(inputs, report_id, source_ids, modification_ids):
+    """
+        Returns the inputs of a snapshot with the ids of the copies, so that the snapshots taken
+        before and after a move can be compared.
+    """
+    return {
+        "Sources": [
+            dict(row, id=source_ids.get(row["id"], row["id"]), report_id=report_id) for row in inputs["Sources"]
+        ],
+        "Modifications": [
+            dict(row, id=modification_ids.get(row["id"], row["id"]), source_id=source_ids.get(row["source_id"], row["source_id"]))
+            for row in inputs["Modifications"]
+        ],
+    }
+
+
+def copy_report(report, shard, move):
+    """
+        Copies `report` with its sources, modifications, snapshots and jobs to `shard`, in one
+        transaction on `shard`. The id of the copy and the new ids of its rows (MovedRow) are
+        stored before the transaction is committed, so a copy that exists is always known.
+    """
+    from .models import Modification, MovedRow, ProjectionJob, ReportMove, ReportSnapshot, Source
+    from .rollover import rollover_report
+
+    db = report._state.db
+    source_ids, modification_ids = {}, {}
+    # The change log and the move are committed first: if the copy is not committed after all,
+    # the move points to a report that does not exist and the copy is made again
+    with transaction.atomic(using=shard), transaction.atomic(using=DEFAULT_DB_ALIAS):
+        new_report, nb_sources, nb_modifications = rollover_report(
+            report, report.date, report.name, using=shard, source_ids=source_ids, modification_ids=modification_ids
+        )
+        snapshots = list(ReportSnapshot.objects.using(db).filter(report=report).order_by('id'))
+        created = ReportSnapshot.objects.using(shard).bulk_create([
+            ReportSnapshot(
+                report=new_report, name=snapshot.name, created_at=snapshot.created_at, year=snapshot.year, to=snapshot.to,
+                total_emission=snapshot.total_emission, delta=snapshot.delta, totals=snapshot.totals,
+                deltas=snapshot.deltas, inputs=remap_inputs(snapshot.inputs, new_report.id, source_ids, modification_ids),
+            )
+            for snapshot in snapshots
+        ])
+        snapshot_ids = {snapshot.id: copy.id for snapshot, copy in zip(snapshots, created)}
+        # The jobs keep their id, so that they can still be polled. The worker of a job that is
+        # not finished writes to the old shard, the copy is failed and has to be submitted again.
+        jobs = []
+        for job in ProjectionJob.objects.using(db).filter(report=report):
+            if job.status in (ProjectionJob.PENDING, ProjectionJob.RUNNING):
+                job.status = ProjectionJob.FAILED
+                job.error = "Report moved to %s" % new_report.id
+                job.finished_at = timezone.now()
+            job.report_id = new_report.id
+            jobs.append(job)
+        ProjectionJob.objects.using(shard).bulk_create(jobs)
+
+        MovedRow.objects.bulk_create([
+            MovedRow(move_id=move.id, model=model._meta.model_name, old_id=old_id, new_id=new_id)
+            for model, ids in ((Source, source_ids), (Modification, modification_ids), (ReportSnapshot, snapshot_ids))
+            for old_id, new_id in ids.items()
+        ], batch_size=2000)
+        ReportMove.objects.filter(id=move.id).update(new_report_id=new_report.id)
+    move.new_report_id = new_report.id
+    return new_report
+
+
+def move_report(report, shard):
+    """
+        Moves `report` with its sources, modifications, snapshots and jobs to `shard`.
+
+        Since the shard is encoded in the ids, the moved rows get new ids: this is a break for
+        the clients holding the old ids, the moves appear in the change feed as deletes followed
+        by creates and the old ids of the report, its sources and its snapshots answer with
+        their new ids (see ReportMove and MovedRow).
+        The report is copied, then deleted from its old shard. If the move stopped in between,
+        running it again reuses the copy (or removes it when the report goes to another shard).
+        Returns the report on its new shard.
+    """
+    from .models import Report, ReportMove
+
+    move = ReportMove.objects.filter(report_id=report.id, finished_at__isnull=True).order_by('-id').first()
+    new_report = None
+    if move is not None and move.new_report_id is not None:
+        new_report = Report.objects.using(move.to_shard).filter(id=move.new_report_id).first()
+        if new_report is not None and move.to_shard != shard:
+            new_report.delete()
+            new_report = None
+    if move is None:
+        move = ReportMove.objects.create(report_id=report.id, from_shard=report._state.db, to_shard=shard)
+    elif new_report is None:
+        move.movedrow_set.all().delete()
+        move.to_shard, move.new_report_id = shard, None
+        move.save(update_fields=['to_shard', 'new_report_id'])
+
+    if new_report is None:
+        new_report = copy_report(report, shard, move)
+    report.delete()
+    move.finished_at = timezone.now()
+    move.save(update_fields=['finished_at'])
+    return new_report
+
+
+def get_new_id(model, old_id):
+    """
+        Returns the id a moved report, source, modification or snapshot has now,
+        or None if the row `old_id` of `model` was not moved.
+    """
+    from .models import MovedRow, Report, ReportMove
+
+    new_id = None
+    while True:
+        if model is Report:
+            move = ReportMove.objects.filter(report_id=old_id, finished_at__isnull=False).order_by('-id').first()
+            moved_id = move.new_report_id if move is not None else None
+        else:
+            moved_id = (
+                MovedRow.objects.filter(model=model._meta.model_name, old_id=old_id, move__finished_at__isnull=False)
+                .order_by('-id').values_list('new_id', flat=True).first()
+            )
+        if moved_id is None:
+            return new_id
+        new_id = old_id = moved_id
+
+
+def resume_moves():
+    """
+        Finishes the moves that stopped before the end. Returns the finished moves.
+    """
+    from .models import Report, ReportMove
+
+    moves = []
+    for move in ReportMove.objects.filter(finished_at__isnull=True).order_by('id'):
+        report = Report.objects.using(move.from_shard).filter(id=move.report_id).first()
+        if report is not None:
+            move_report(report, move.to_shard)
+        elif move.new_report_id is not None and Report.objects.using(move.to_shard).filter(id=move.new_report_id).exists():
+            # Stopped after the delete
+            move.finished_at = timezone.now()
+            move.save(update_fields=['finished_at'])
+        else:
+            # The report was deleted before it was copied
+            move.delete()
+            continue
+        move.refresh_from_db()
+        moves.append(move)
+    return moves
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Modification, ReportSnapshot, Source
+
+
+def get_row(instance):
+    """
+        Returns the fields of `instance` as QuerySet.values() would.
+    """
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def take_snapshot(report, year, to=None, name=None):
+    """
+        Computes the yearly totals and deltas of `report` from `year` to `to` and stores them,
+        along with the sources and modifications used, in a single insert.
+        The sources and modifications are read once, in a transaction, so the stored inputs are
+        the ones the totals were computed from.
+    """
+    with transaction.atomic(using=report._state.db):
+        return _take_snapshot(report, year, to, name)
+
+
+def _take_snapshot(report, year, to, name):
+    to = year if to is None or to < year else to
+    db = report._state.db
+    sources = list(Source.objects.using(db).filter(report=report))
+    modifications = list(Modification.objects.using(db).filter(source__report=report).order_by("acquisition_year"))
+
+    modifs_by_source = defaultdict(list)
+    for modif in modifications:
+        modifs_by_source[modif.source_id].append(modif)
+
+    def get_total(year):
+        return sum(source.get_total_emissions(year, modifs_by_source[source.id]) for source in sources)
+
+    def get_delta(year):
+        return sum(source.get_delta(year, modifs_by_source[source.id]) for source in sources)
+
+    return ReportSnapshot.objects.using(db).create(
+        report=report,
+        name=name,
+        year=year,
+        to=to,
+        total_emission=get_total(None),
+        delta=get_delta(None),
+        totals={str(i): get_total(i) for i in range(year, to+1)},
+        deltas={str(i): get_delta(i) for i in range(year, to+1)},
+        inputs={
+            "Sources": [get_row(source) for source in sources],
+            "Modifications": [get_row(modif) for modif in modifications],
+        },
+    )
+
+
+def diff_snapshots(snapshot_from, snapshot_to):
+    """
+        Compares two snapshots year by year, and lists the sources and modifications
+        added or removed between them.
+    """
+    def diff_series(series_from, series_to):
+        years = sorted(set(series_from) | set(series_to), key=int)
+        diff = {}
+        for year in years:
+            value_from = series_from.get(year)
+            value_to = series_to.get(year)
+            diff[year] = {
+                "from": value_from,
+                "to": value_to,
+                "difference": None if value_from is None or value_to is None else value_to - value_from,
+            }
+        return diff
+
+    def diff_ids(key):
+        ids_from = {row["id"] for row in snapshot_from.inputs[key]}
+        ids_to = {row["id"] for row in snapshot_to.inputs[key]}
+        return {"added": sorted(ids_to - ids_from), "removed": sorted(ids_from - ids_to)}
+
+    return {
+        "Total Emission": {
+            "from": snapshot_from.total_emission,
+            "to": snapshot_to.total_emission,
+            "difference": snapshot_to.total_emission - snapshot_from.total_emission,
+        },
+        "Delta": {
+            "from": snapshot_from.delta,
+            "to": snapshot_to.delta,
+            "difference": snapshot_to.delta - snapshot_from.delta,
+        },
+        "List of emission": diff_series(snapshot_from.totals, snapshot_to.totals),
+        "List of delta": diff_series(snapshot_from.deltas, snapshot_to.deltas),
+        "Sources": diff_ids("Sources"),
+        "Modifications": diff_ids("Modifications"),
+    }
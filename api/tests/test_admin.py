@@ -0,0 +1,94 @@
+from datetime import date
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TestCase
+
+from api.admin import get_estimated_count
+from api.models import Report, Source, Modification, ChangeLogEntry
+
+class TestAdmin(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.source = self.create_report(0)
+
+    def create_report(self, i):
+        report = Report.objects.create(name='Report %s' % i, date='2023-01-01')
+        source = Source.objects.create(
+            report=report, description='Source %s' % i, value=10, emission_factor=2.0,
+            total_emission=1000, lifetime=5, acquisition_year=2020
+        )
+        for j in range(30):
+            Modification.objects.create(
+                source=source, description='modif %s' % j, ratio=1, emission_factor=1,
+                total_emission=10, acquisition_year='2021-01-01', lifetime=1
+            )
+        return source
+
+    def test_report_changelist_queries_do_not_grow(self):
+        with self.assertNumQueries(7) as context:
+            response = self.client.get('/admin/api/report/')
+        self.assertContains(response, '1300.0')    # 1000 + 30 x 10
+
+        for i in range(1, 5):
+            self.create_report(i)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get('/admin/api/report/')
+
+    def test_modification_inline_is_paginated(self):
+        response = self.client.get('/admin/api/source/%s/change/' % self.source.id)
+        self.assertEquals(response.context['inline_admin_formsets'][0].formset.total_form_count(), 20)
+        self.assertContains(response, '1 / 2 (30 modifications)')
+
+        response = self.client.get('/admin/api/source/%s/change/?inline_page=2' % self.source.id)
+        self.assertEquals(response.context['inline_admin_formsets'][0].formset.total_form_count(), 10)
+
+    def test_changelists_and_search(self):
+        self.assertContains(self.client.get('/admin/api/source/?q=Source'), 'Source 0')
+        self.assertContains(self.client.get('/admin/api/modification/?q=modif'), 'modif 29')
+
+    def test_changelists_with_nameless_report_and_source(self):
+        report = Report.objects.create(date='2023-01-01')
+        source = Source.objects.create(report=report, value=1, emission_factor=1, total_emission=10, lifetime=1, acquisition_year=2020)
+        Modification.objects.create(source=source, ratio=1, emission_factor=1, total_emission=1, acquisition_year='2021-01-01', lifetime=1)
+        self.assertContains(self.client.get('/admin/api/report/'), 'Report %s' % report.id)
+        self.assertContains(self.client.get('/admin/api/source/'), 'Report %s' % report.id)
+        self.assertContains(self.client.get('/admin/api/modification/'), 'Source %s' % source.id)
+
+    def test_year_emission(self):
+        self.create_report(1).modification_set.update(lifetime=100)
+        response = self.client.get('/admin/api/report/')
+        year = date.today().year
+        for report in response.context['cl'].result_list:
+            sources = Source.objects.filter(report=report)
+            self.assertAlmostEqual(report.year_emission, report.get_total_emissions(year, sources))
+        self.assertNotEquals(response.context['cl'].result_list[0].year_emission, response.context['cl'].result_list[1].year_emission)
+
+    @skipUnless(connection.vendor == 'sqlite', "The plan is read with EXPLAIN QUERY PLAN")
+    def test_search_uses_index(self):
+        request = RequestFactory().get('/')
+        for model, index in [
+            (Report, 'api_report_name_search'),
+            (Source, 'api_source_description_search'),
+            (Modification, 'api_modification_description_search'),
+        ]:
+            model_admin = admin.site._registry[model]
+            queryset, _ = model_admin.get_search_results(request, model.objects.only('id'), 'Sour')
+            self.assertIn('USING COVERING INDEX %s' % index, queryset.explain())
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEquals(get_estimated_count(Modification, 'default'), 30)
+
+    def test_modification_deletes_are_logged(self):
+        modif_ids = list(Modification.objects.filter(source=self.source).values_list('id', flat=True))
+        self.client.post('/admin/api/modification/%s/delete/' % modif_ids[0], {'post': 'yes'})
+        self.client.post('/admin/api/modification/', {'action': 'delete_selected', 'post': 'yes', '_selected_action': modif_ids[1:3]})
+
+        logged = ChangeLogEntry.objects.filter(model='modification', action=ChangeLogEntry.DELETE)
+        self.assertEquals(sorted(logged.values_list('object_id', flat=True)), modif_ids[:3])
+        self.assertEquals(set(logged.values_list('report_id', flat=True)), {self.source.report_id})
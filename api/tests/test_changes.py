@@ -0,0 +1,93 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import Report, Source, Modification, ChangeLogEntry
+
+class TestChanges(TestCase):
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2020-02-23'
+        )
+        self.source1 = Source.objects.create(
+            report = self.report1,
+            description = 'Source 1',
+            value = 10,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2020
+        )
+        self.client.post('/api/sources/%s/' % self.source1.id, {
+            'description': 'modif 1', 'emission_factor': 1, 'total_emission': 60, 'acquisition_year': '2023-02-23', 'lifetime': 3,
+        })
+
+    def get_changes(self, after=0, limit=100):
+        return self.client.get('/api/changes/?after=%s&limit=%s' % (after, limit)).json()
+
+    def test_creates_are_logged(self):
+        feed = self.get_changes()
+        self.assertEquals(
+            [(change["model"], change["action"], change["report_id"]) for change in feed["Changes"]],
+            [("report", "create", self.report1.id), ("source", "create", self.report1.id), ("modification", "create", self.report1.id)]
+        )
+        self.assertFalse(feed["Has more"])
+        self.assertEquals(self.get_changes(after=feed["Cursor"])["Changes"], [])
+
+    def test_cascade_deletes_are_logged(self):
+        cursor = self.get_changes()["Cursor"]
+        self.client.delete('/api/reports/%s/' % self.report1.id)
+
+        changes = self.get_changes(after=cursor)["Changes"]
+        self.assertEquals(
+            sorted((change["model"], change["action"]) for change in changes),
+            [("modification", "delete"), ("report", "delete"), ("source", "delete")]
+        )
+
+    def test_deletes_are_logged_in_a_fixed_number_of_queries(self):
+        Modification.objects.bulk_create([
+            Modification(source=self.source1, description='modif', ratio=1, emission_factor=1, total_emission=1,
+                         acquisition_year='2024-01-01', lifetime=1)
+            for _ in range(200)
+        ])
+        cursor = self.get_changes()["Cursor"]
+        report_id = self.report1.id
+        with CaptureQueriesContext(connection) as context:
+            self.report1.delete()
+        self.assertLess(len(context.captured_queries), 20)
+
+        changes = ChangeLogEntry.objects.filter(id__gt=cursor)
+        self.assertEquals(changes.filter(model='modification', action='delete', report_id=report_id).count(), 201)
+        self.assertEquals(changes.filter(model='source', action='delete').count(), 1)
+        self.assertEquals(changes.filter(model='report', action='delete').count(), 1)
+
+    def test_source_deletes_are_logged(self):
+        cursor = self.get_changes()["Cursor"]
+        self.client.delete('/api/sources/%s/' % self.source1.id)
+        Source.objects.create(report=self.report1, description='Source 2', value=1, emission_factor=1, total_emission=1, lifetime=1, acquisition_year=2020)
+        Source.objects.all().delete()
+
+        self.assertEquals(
+            [(change["model"], change["action"]) for change in self.get_changes(after=cursor)["Changes"]],
+            [("source", "delete"), ("modification", "delete"), ("source", "create"), ("source", "delete")]
+        )
+
+    def test_pages(self):
+        self.client.post('/api/reports/%s/rollover/' % self.report1.id, {'date': '2021-02-23'}, content_type='application/json')
+        self.assertEquals(ChangeLogEntry.objects.count(), 6)
+
+        first = self.get_changes(limit=4)
+        self.assertEquals(len(first["Changes"]), 4)
+        self.assertTrue(first["Has more"])
+        second = self.get_changes(after=first["Cursor"], limit=4)
+        self.assertEquals(len(second["Changes"]), 2)
+        self.assertFalse(second["Has more"])
+
+        self.assertEquals(self.client.get('/api/changes/?limit=0').status_code, 400)
+        self.assertEquals(self.client.get('/api/changes/?limit=-5').status_code, 400)
+        self.assertEquals(self.client.get('/api/changes/?after=abc').status_code, 400)
+        self.assertEquals(self.client.get('/api/changes/?after=-1').status_code, 400)
+        self.assertEquals(
+            [change["model"] for change in second["Changes"]], ["source", "modification"]
+        )
@@ -0,0 +1,205 @@
+import random
+from datetime import date
+
+from django.test import TestCase
+from api import emissions
+from api.models import Report, Source, Modification
+
+class TestEmissions(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.report1 = Report.objects.create(name='Report 1', date='2020-02-23')
+        self.report2 = Report.objects.create(name='Report 2', date='2023-02-23')
+        for i in range(30):
+            source = Source.objects.create(
+                report = self.report1 if i % 3 else self.report2,
+                description = 'Source %s' % (i % 4),
+                value = rng.randint(1, 50),
+                emission_factor = rng.choice([0.5, 1.0, 2.0, 8.95]),
+                total_emission = rng.randint(100, 5000),
+                lifetime = rng.randint(0, 8),
+                acquisition_year = rng.randint(2015, 2025)
+            )
+            for j in range(rng.randint(0, 4)):
+                Modification.objects.create(
+                    source = source,
+                    description = 'modif %s' % j,
+                    ratio = rng.choice([0.5, 1, 2]),
+                    emission_factor = rng.choice([0.5, 1.0, 3.0]),
+                    total_emission = rng.randint(0, 500),
+                    acquisition_year = date(source.acquisition_year + rng.randint(0, 6), rng.randint(1, 12), 1),
+                    lifetime = rng.randint(0, 5),
+                )
+
+    def assert_match_models(self, sources):
+        modifs_by_source = emissions.load_modifications(Modification.objects.filter(source__in=sources))
+        for source in emissions.load_sources(sources):
+            model = Source.objects.get(id=source.id)
+            modif_list = list(Modification.objects.filter(source=model).order_by("acquisition_year"))
+            modifs = modifs_by_source.get(source.id, [])
+
+            series = emissions.get_series(source, modifs, 2010, 2040)
+            for year in range(2010, 2041):
+                self.assertAlmostEqual(series[year], model.get_total_emissions(year, modif_list))
+                self.assertAlmostEqual(emissions.get_delta(source, modifs, year), model.get_delta(year, modif_list))
+            self.assertAlmostEqual(emissions.get_total(source, modifs), model.get_total_emissions(None, modif_list))
+            self.assertAlmostEqual(emissions.get_delta(source, modifs), model.get_delta(None, modif_list))
+
+    def test_series_and_delta_match_models(self):
+        self.assert_match_models(Source.objects.all())
+
+    def test_lifetime_zero_matches_models(self):
+        source = Source.objects.create(
+            report=self.report1, description='Source 0', value=10, emission_factor=2.0,
+            total_emission=1000, lifetime=0, acquisition_year=2020
+        )
+        for j, lifetime in enumerate([0, 2, 0]):
+            Modification.objects.create(
+                source=source, description='modif %s' % j, ratio=2, emission_factor=1.0,
+                total_emission=100, acquisition_year=date(2021 + j, 1, 1), lifetime=lifetime,
+            )
+        self.assert_match_models(Source.objects.filter(id=source.id))
+
+        response = self.client.get('/api/sources/%s/?year=2020&to=2025' % source.id)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["List of emission"]["2020"], 20)     # no amortization, 10 x 2.0
+
+    def test_rollup_by_description(self):
+        response = self.client.get('/api/rollups/?group_by=description&year=2018&to=2030&date_from=2020-01-01').json()
+        rollup = response["Rollup"]
+
+        for key in rollup:
+            sources = list(Source.objects.filter(description=key, report__date__gte='2020-01-01'))
+            for year in range(2018, 2031):
+                self.assertAlmostEqual(rollup[key][str(year)], self.report1.get_total_emissions(year, sources))
+
+    def test_rollup_skips_incomplete_sources(self):
+        url = '/api/rollups/?group_by=report&year=2018&to=2030'
+        before = self.client.get(url).json()["Rollup"]
+        for missing in ('acquisition_year', 'value', 'emission_factor', 'total_emission'):
+            fields = dict(value=10, emission_factor=2.0, total_emission=1000, lifetime=5, acquisition_year=2020)
+            fields[missing] = None
+            source = Source.objects.create(report=self.report1, description='Incomplete', **fields)
+            Modification.objects.create(source=source, emission_factor=1.0, total_emission=None, acquisition_year=date(2022, 1, 1), lifetime=2)
+            Modification.objects.create(source=source, emission_factor=None, total_emission=10, acquisition_year=None, lifetime=2)
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        rollup = response.json()["Rollup"]
+        self.assertEquals(rollup[str(self.report2.id)], before[str(self.report2.id)])
+        # Only the complete source ('total_emission' missing) counts: 2.0 x 10 a year, then 1.0 x 10 from 2022
+        self.assertAlmostEqual(rollup[str(self.report1.id)]["2021"] - before[str(self.report1.id)]["2021"], 20)
+        self.assertAlmostEqual(rollup[str(self.report1.id)]["2023"] - before[str(self.report1.id)]["2023"], 10)
+
+        response = self.client.get('/api/rollups/?group_by=report')
+        self.assertEquals(response.status_code, 200)
+
+    def test_rollup_filters(self):
+        response = self.client.get('/api/rollups/?group_by=report&key=%s' % self.report2.id).json()
+        sources = list(Source.objects.filter(report=self.report2))
+        self.assertEquals(list(response["Rollup"]), [str(self.report2.id)])
+        self.assertAlmostEqual(response["Rollup"][str(self.report2.id)]["total"], self.report2.get_total_emissions(None, sources))
+
+        response = self.client.get('/api/rollups/?group_by=color')
+        self.assertEquals(response.status_code, 400)
+
+    def test_batched_source_projections(self):
+        source_ids = list(Source.objects.values_list('id', flat=True)[:10])
+        url = '/api/sources/?ids=%s&year=2018&to=2030' % ','.join(str(i) for i in source_ids + [0])
+        with self.assertNumQueries(2):
+            response = self.client.get(url).json()
+
+        self.assertEquals(response["Missing "], [0])
+        for source_id in source_ids:
+            projection = response["Sources "][str(source_id)]
+            detail = self.client.get('/api/sources/%s/?year=2018&to=2030' % source_id).json()
+            self.assertEquals(projection["Source"], detail["Source"])
+            self.assertAlmostEqual(projection["Delta"], detail["Delta"])
+            for year, emission in detail["List of emission"].items():
+                self.assertAlmostEqual(projection["List of emission"][year], emission)
+
+        response = self.client.get('/api/sources/?ids=%s' % source_ids[0]).json()
+        detail = self.client.get('/api/sources/%s/' % source_ids[0]).json()
+        self.assertAlmostEqual(response["Sources "][str(source_ids[0])]["List of emission"]["total"], detail["List of emission"]["total"])
+
+    def test_cumulative_and_window_sums(self):
+        url = '/api/reports/%s/?year=2018&to=2030&cumulative=true&window=4' % self.report1.id
+        response = self.client.get(url).json()
+        series = response["List of emission "]
+
+        for year in range(2018, 2031):
+            self.assertAlmostEqual(response["Cumulative emission "][str(year)], sum(series[str(i)] for i in range(2018, year + 1)))
+        self.assertEquals(list(response["Window emission "]), [str(year) for year in range(2021, 2031)])
+        for year in range(2021, 2031):
+            self.assertAlmostEqual(response["Window emission "][str(year)], sum(series[str(i)] for i in range(year - 3, year + 1)))
+
+        source = Source.objects.filter(report=self.report1).first()
+        response = self.client.get('/api/sources/%s/?year=2018&to=2030&window=13' % source.id).json()
+        self.assertNotIn("Cumulative emission", response)
+        self.assertAlmostEqual(response["Window emission"]["2030"], sum(response["List of emission"].values()))
+
+        self.assertEquals(self.client.get('/api/reports/%s/?cumulative=true' % self.report1.id).status_code, 400)
+        self.assertEquals(self.client.get('/api/sources/%s/?year=2018&window=0' % source.id).status_code, 400)
+
+    def test_modification_impact(self):
+        source = Source.objects.filter(report=self.report1).first()
+        report_url = '/api/reports/%s/?year=2018&to=2030' % self.report1.id
+        source_url = '/api/sources/%s/?year=2018&to=2030' % source.id
+        report_before = self.client.get(report_url).json()
+        source_before = self.client.get(source_url).json()
+
+        modification = {
+            "description": "impact", "ratio": 2.0, "emission_factor": 1.5, "total_emission": 300,
+            "acquisition_year": "%s-06-01" % (source.acquisition_year + 2), "lifetime": 3,
+        }
+        response = self.client.post(source_url + '&impact=true', modification, content_type='application/json')
+        self.assertEquals(response.status_code, 201)
+        impact = response.json()["Impact"]
+
+        report_after = self.client.get(report_url).json()
+        source_after = self.client.get(source_url).json()
+        for year in range(2018, 2031):
+            self.assertAlmostEqual(impact["Source"]["List of emission"][str(year)],
+                source_after["List of emission"][str(year)] - source_before["List of emission"][str(year)])
+            self.assertAlmostEqual(impact["Report"]["List of emission"][str(year)],
+                report_after["List of emission "][str(year)] - report_before["List of emission "][str(year)])
+        self.assertAlmostEqual(impact["Source"]["Delta"], source_after["Delta"] - source_before["Delta"])
+        self.assertAlmostEqual(impact["Report"]["Delta"], report_after["Delta "] - report_before["Delta "])
+        self.assertAlmostEqual(impact["Report"]["Total Emission"], report_after["Total Emission "] - report_before["Total Emission "])
+
+        # Years frozen in a snapshot do not change
+        self.client.post('/api/reports/%s/snapshots/' % self.report1.id, {'year': 2018, 'to': 2022})
+        response = self.client.post(source_url + '&impact=true', modification, content_type='application/json')
+        impact = response.json()["Impact"]["Report"]
+        self.assertEquals([impact["List of emission"][str(year)] for year in range(2018, 2023)], [0] * 5)
+        self.assertEquals(impact["Total Emission"], 0)
+
+        response = self.client.post('/api/sources/%s/' % source.id, modification, content_type='application/json')
+        self.assertNotIn("Impact", response.json())
+
+    def test_source_detail_pages_modifications(self):
+        source = Source.objects.filter(report=self.report1).first()
+        for j in range(25):
+            Modification.objects.create(
+                source=source, description='page %s' % j, ratio=1, emission_factor=1.0, total_emission=10,
+                acquisition_year=date(source.acquisition_year + j % 3, 1, 1), lifetime=2,
+            )
+        modif_list = list(Modification.objects.filter(source=source).order_by('acquisition_year', 'id'))
+
+        ids = []
+        url = '/api/sources/%s/?year=2018&to=2030&limit=10' % source.id
+        response = self.client.get(url).json()
+        while True:
+            ids += [modif["id"] for modif in response["Modifications"]]
+            self.assertAlmostEqual(response["Total Emission"], source.get_total_emissions(2018, modif_list))
+            self.assertAlmostEqual(response["Delta"], source.get_delta(2018, modif_list))
+            if not response["Has more"]:
+                break
+            response = self.client.get(url + '&cursor=' + response["Cursor"]).json()
+        self.assertEquals(ids, [modif.id for modif in modif_list])
+
+        for year in range(2018, 2031):
+            self.assertAlmostEqual(response["List of emission"][str(year)], source.get_total_emissions(year, modif_list))
+        self.assertEquals(self.client.get(url + '&cursor=nope').status_code, 400)
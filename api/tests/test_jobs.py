@@ -0,0 +1,107 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.jobs import run_job
+from api.models import Report, Source, ProjectionJob
+
+@override_settings(PROJECTION_JOBS_SYNC=True)
+class TestJobs(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2020-02-23'
+        )
+        Source.objects.create(
+            report = self.report1,
+            description = 'Source 1',
+            value = 10,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2020
+        )
+
+    def test_job_result(self):
+        response = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020, 'to': 2026})
+        self.assertEquals(response.status_code, 202)
+        job_id = response.json()["Job"]["id"]
+
+        response = self.client.get('/api/jobs/%s/' % job_id)
+        job = response.json()["Job"]
+        self.assertEquals(job["status"], ProjectionJob.DONE)
+        self.assertEquals(job["result"]["Total Emission"], 220)
+        self.assertEquals(job["result"]["List of emission"]["2025"], 20)
+        self.assertEquals(len(job["result"]["List of emission"]), 7)
+
+    def test_job_deduplication(self):
+        first = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020, 'to': 2026}).json()
+        second = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020, 'to': 2026})
+        self.assertEquals(second.status_code, 200)
+        self.assertEquals(second.json()["Job"]["id"], first["Job"]["id"])
+
+        other = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2021, 'to': 2026}).json()
+        self.assertNotEquals(other["Job"]["id"], first["Job"]["id"])
+        self.assertEquals(ProjectionJob.objects.count(), 2)
+
+    def test_job_expiry(self):
+        job_id = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]["id"]
+        ProjectionJob.objects.filter(id=job_id).update(finished_at=timezone.now() - timedelta(days=1))
+
+        self.assertEquals(self.client.get('/api/jobs/%s/' % job_id).status_code, 404)
+        new_job_id = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]["id"]
+        self.assertNotEquals(new_job_id, job_id)
+        self.assertFalse(ProjectionJob.objects.filter(id=job_id).exists())
+
+    @override_settings(PROJECTION_JOB_MAX_PENDING=0, PROJECTION_JOBS_SYNC=False)
+    def test_job_queue_full(self):
+        response = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020})
+        self.assertEquals(response.status_code, 503)
+
+    def test_job_is_not_reused_after_data_change(self):
+        first = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]
+        self.assertEquals(first["result"]["Total Emission"], 220)
+
+        Source.objects.create(
+            report=self.report1, description='Source 2', value=10, emission_factor=2.0,
+            total_emission=1000, lifetime=5, acquisition_year=2020
+        )
+        response = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020})
+        self.assertEquals(response.status_code, 202)
+        self.assertEquals(response.json()["Job"]["result"]["Total Emission"], 440)
+
+    def test_dead_job_is_failed(self):
+        job_id = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]["id"]
+        ProjectionJob.objects.filter(id=job_id).update(
+            status=ProjectionJob.RUNNING, finished_at=None, started_at=timezone.now() - timedelta(days=1)
+        )
+
+        response = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020})
+        self.assertEquals(response.status_code, 202)
+        self.assertNotEquals(response.json()["Job"]["id"], job_id)
+        self.assertEquals(self.client.get('/api/jobs/%s/' % job_id).json()["Job"]["status"], ProjectionJob.FAILED)
+
+    def test_queued_job_does_not_time_out(self):
+        job_id = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]["id"]
+        ProjectionJob.objects.filter(id=job_id).update(
+            status=ProjectionJob.PENDING, result=None, finished_at=None, created_at=timezone.now() - timedelta(days=1)
+        )
+
+        response = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()["Job"]["id"], job_id)
+        run_job(job_id)
+        self.assertEquals(ProjectionJob.objects.get(id=job_id).status, ProjectionJob.DONE)
+
+    def test_failed_job_is_not_overwritten(self):
+        def fail_job(*args, **kwargs):
+            ProjectionJob.objects.update(status=ProjectionJob.FAILED, error="Timed out")
+            return {2020: 220}
+
+        with mock.patch.object(Report, 'get_list_of_emission', side_effect=fail_job):
+            job = self.client.post('/api/reports/%s/jobs/' % self.report1.id, {'year': 2020}).json()["Job"]
+        self.assertEquals(job["status"], ProjectionJob.FAILED)
+        self.assertIsNone(job["result"])
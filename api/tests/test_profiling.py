@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from api.models import Report, Source
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2020-02-23'
+        )
+        Source.objects.create(
+            report = self.report1,
+            description = 'Source 1',
+            value = 10,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2020
+        )
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.user = User.objects.create_user('user', password='password')
+
+    def test_profile_for_staff(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/reports/%s/?year=2020&to=2025&profile=tottime' % self.report1.id).json()
+
+        self.assertEquals(response["status"], 200)
+        self.assertIn("function calls", response["profile"])
+        self.assertIn("Ordered by: internal time", response["profile"])
+        self.assertEquals(response["queries_count"], len(response["queries"]))
+        self.assertTrue(any('"api_source"' in query["sql"] for query in response["queries"]))
+
+    def test_profile_with_header_stored(self):
+        self.client.force_login(self.staff)
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(PROFILE_DIR=profile_dir):
+            response = self.client.get('/api/reports/%s/' % self.report1.id, HTTP_X_PROFILE='cumulative').json()
+            self.assertTrue(os.path.exists(response["file"]))
+
+    def test_profile_ignored_for_other_users(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/reports/%s/?profile=' % self.report1.id).json()
+        self.assertNotIn("profile", response)
+        self.assertIn("List of emission ", response)
@@ -0,0 +1,41 @@
+import gzip
+import json
+from datetime import date
+
+from django.test import TestCase, override_settings
+from api.models import Report, Source
+from api.renderers import FastJSONRenderer
+
+class TestRenderers(TestCase):
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2020-02-23'
+        )
+        for i in range(50):
+            Source.objects.create(
+                report = self.report1,
+                description = 'Source %s' % i,
+                value = 10,
+                emission_factor = 2.0,
+                total_emission = 1000,
+                lifetime = 5,
+                acquisition_year = 2020
+            )
+
+    def test_render_int_keys_and_dates(self):
+        content = FastJSONRenderer().render({"List of emission": {2020: 1.5, 2021: 0}, "date": date(2023, 4, 19)})
+        self.assertEquals(json.loads(content), {"List of emission": {"2020": 1.5, "2021": 0}, "date": "2023-04-19"})
+
+    def test_report_detail_gzipped(self):
+        response = self.client.get('/api/reports/%s/?year=2020&to=2030' % self.report1.id, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEquals(len(data["Sources "]), 50)
+        self.assertEquals(data["List of emission "]["2020"], 50 * 220)
+
+    @override_settings(GZIP_MIN_LENGTH=10**6)
+    def test_small_response_not_gzipped(self):
+        response = self.client.get('/api/reports/%s/' % self.report1.id, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,73 @@
+from django.test import TestCase
+from api.models import Report, Source, Modification
+
+class TestRollover(TestCase):
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2023-02-23'
+        )
+        for i in range(3):
+            source = Source.objects.create(
+                report = self.report1,
+                description = 'Source %s' % i,
+                value = 10,
+                emission_factor = 2.0,
+                total_emission = 1000,
+                lifetime = 5,
+                acquisition_year = 2020
+            )
+            Modification.objects.create(
+                source = source,
+                description = 'modif %s' % i,
+                emission_factor = 1,
+                total_emission = 60,
+                acquisition_year = '2023-02-23',
+                lifetime = 3,
+            )
+
+    def test_rollover_clones_report(self):
+        response = self.client.post('/api/reports/%s/rollover/' % self.report1.id, {
+            'name': 'Report 2', 'date': '2024-02-23',
+        }, content_type='application/json')
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(response.json()["Sources cloned"], 3)
+        self.assertEquals(response.json()["Modifications cloned"], 3)
+
+        report2 = Report.objects.get(name='Report 2')
+        sources = list(Source.objects.filter(report=report2))
+        self.assertEquals(len(sources), 3)
+        for source in sources:
+            modifs = list(Modification.objects.filter(source=source))
+            self.assertEquals(len(modifs), 1)
+            self.assertEquals(modifs[0].description, source.description.replace('Source', 'modif'))
+
+        self.assertEquals(report2.get_total_emissions(2023, sources), self.report1.get_total_emissions(2023, Source.objects.filter(report=self.report1)))
+        self.assertEquals(Source.objects.filter(report=self.report1).count(), 3)
+
+    def test_rollover_overrides(self):
+        response = self.client.post('/api/reports/%s/rollover/' % self.report1.id, {
+            'date': '2024-02-23', 'source_overrides': {'emission_factor': 3.0}, 'modification_overrides': {'ratio': 2},
+        }, content_type='application/json')
+        report2 = Report.objects.get(id=response.json()["Report created : "]["id"])
+        self.assertEquals(report2.name, 'Report 1')
+        self.assertEquals(set(Source.objects.filter(report=report2).values_list('emission_factor', flat=True)), {3.0})
+        self.assertEquals(set(Modification.objects.filter(source__report=report2).values_list('ratio', flat=True)), {2})
+
+    def test_rollover_invalid(self):
+        response = self.client.post('/api/reports/%s/rollover/' % self.report1.id, {
+            'date': '2024-02-23', 'source_overrides': {'report': 1},
+        }, content_type='application/json')
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.post('/api/reports/%s/rollover/' % self.report1.id, {
+            'date': '2024-02-23', 'source_overrides': {'lifetime': 'abc'}, 'modification_overrides': {'acquisition_year': 'never'},
+        }, content_type='application/json')
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('lifetime', response.json()["Source overrides error : "])
+        self.assertIn('acquisition_year', response.json()["Modification overrides error : "])
+
+        response = self.client.post('/api/reports/%s/rollover/' % self.report1.id, {}, content_type='application/json')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(Report.objects.count(), 1)
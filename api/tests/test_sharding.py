@@ -0,0 +1,205 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from api.models import Report, Source, Modification, ChangeLogEntry, ProjectionJob, ReportMove
+from api.rollover import rollover_report
+from api.sharding import check_shards, get_shards, move_report, shard_for_id
+from api.snapshots import take_snapshot
+
+SHARDED = len(getattr(settings, 'REPORT_SHARDS', [])) > 1
+
+
+@skipUnless(SHARDED, "Run with PROJECTION_SHARDS=2 to test the sharding")
+class TestSharding(TestCase):
+    databases = set(getattr(settings, 'REPORT_SHARDS', ['default']))
+
+    def create_report(self, name, nb_sources=1):
+        report_id = self.client.post('/api/reports/', {'name': name, 'date': '2020-02-23'}).json()["Report created : "]["id"]
+        for i in range(nb_sources):
+            source_id = self.client.post('/api/sources/', {
+                'report': report_id, 'description': 'Source %s' % i, 'value': 10, 'emission_factor': 2.0,
+                'total_emission': 1000, 'lifetime': 5, 'acquisition_year': 2020,
+            }).json()["Source created "]["id"]
+            self.client.post('/api/sources/%s/' % source_id, {
+                'description': 'modif', 'emission_factor': 1, 'total_emission': 60, 'acquisition_year': '2023-02-23', 'lifetime': 3,
+            })
+        return report_id
+
+    def test_report_rows_stay_on_its_shard(self):
+        report_ids = [self.create_report('Report %s' % i) for i in range(len(get_shards()))]
+        self.assertEquals(sorted(shard_for_id(report_id) for report_id in report_ids), sorted(get_shards()))
+
+        for report_id in report_ids:
+            shard = shard_for_id(report_id)
+            self.assertTrue(Report.objects.using(shard).filter(id=report_id).exists())
+            for source in Source.objects.using(shard).filter(report=report_id):
+                self.assertEquals(shard_for_id(source.id), shard)
+                for modif in Modification.objects.using(shard).filter(source=source):
+                    self.assertEquals(shard_for_id(modif.id), shard)
+
+            detail = self.client.get('/api/reports/%s/?year=2023' % report_id).json()
+            self.assertEquals(detail["Total Emission "], 230)   # 200 + 20 + 10
+
+        self.assertEquals(sorted(report["id"] for report in self.client.get('/api/reports/').json()["Reports : "]), sorted(report_ids))
+        self.assertEquals(len(self.client.get('/api/sources/').json()["Sources "]), len(report_ids))
+        rollup = self.client.get('/api/rollups/?year=2023&to=2023').json()["Rollup"]
+        self.assertEquals(rollup["Source 0"]["2023"], 230 * len(report_ids))
+        self.assertEquals(ChangeLogEntry.objects.filter(model='report').count(), len(report_ids))
+
+    def test_rebalance(self):
+        for i in range(4):
+            report_id = self.create_report('Report %s' % i, nb_sources=1)
+            if shard_for_id(report_id) != get_shards()[0]:
+                self.client.delete('/api/reports/%s/' % report_id)
+        self.assertEquals(Report.objects.using(get_shards()[0]).count(), 2)
+
+        call_command('shards', 'rebalance', verbosity=0, stdout=open('/dev/null', 'w'))
+        self.assertEquals(Report.objects.using(get_shards()[0]).count(), 1)
+        moved = Report.objects.using(get_shards()[1]).get()
+        self.assertEquals(shard_for_id(moved.id), get_shards()[1])
+        self.assertEquals(Modification.objects.using(get_shards()[1]).filter(source__report=moved).count(), 1)
+        self.assertEquals(self.client.get('/api/reports/%s/?year=2023' % moved.id).json()["Total Emission "], 230)
+
+    def test_move_keeps_jobs_and_redirects_old_id(self):
+        report_id = self.create_report('Report')
+        report = Report.objects.using(shard_for_id(report_id)).get(id=report_id)
+        done = ProjectionJob.objects.using(report._state.db).create(key='done', report=report, status=ProjectionJob.DONE, result={'a': 1})
+        pending = ProjectionJob.objects.using(report._state.db).create(key='pending', report=report)
+        shard = [shard for shard in get_shards() if shard != report._state.db][0]
+
+        new_report = move_report(report, shard)
+        self.assertEquals(shard_for_id(new_report.id), shard)
+        jobs = {job.id: job for job in ProjectionJob.objects.using(shard).filter(report=new_report)}
+        self.assertEquals(jobs[done.id].result, {'a': 1})
+        self.assertEquals(jobs[pending.id].status, ProjectionJob.FAILED)
+        self.assertEquals(self.client.get('/api/jobs/%s/' % done.id).json()["Job"]["status"], ProjectionJob.DONE)
+
+        response = self.client.get('/api/reports/%s/?year=2023' % report_id)
+        self.assertEquals(response.status_code, 301)
+        self.assertEquals(response.json()["Report moved, new id : "], new_report.id)
+        self.assertEquals(response["Location"], '/api/reports/%s/' % new_report.id)
+
+    def test_move_redirects_sources_and_snapshots(self):
+        report_id = self.create_report('Report', nb_sources=2)
+        report = Report.objects.using(shard_for_id(report_id)).get(id=report_id)
+        old_sources = list(Source.objects.using(report._state.db).filter(report=report).order_by('id').values_list('id', flat=True))
+        old_snapshot = take_snapshot(report, 2023)
+        shard = [shard for shard in get_shards() if shard != report._state.db][0]
+
+        new_report = move_report(report, shard)
+        new_sources = list(Source.objects.using(shard).filter(report=new_report).order_by('id').values_list('id', flat=True))
+        response = self.client.get('/api/sources/%s/?year=2023' % old_sources[1])
+        self.assertEquals(response.status_code, 301)
+        self.assertEquals(response["Location"], '/api/sources/%s/' % new_sources[1])
+
+        moved_snapshot = self.client.get('/api/snapshots/%s/' % old_snapshot.id)
+        self.assertEquals(moved_snapshot.status_code, 301)
+        moved_snapshot_id = moved_snapshot.json()["Snapshot moved, new id"]
+        new_snapshot = take_snapshot(new_report, 2023)
+        response = self.client.get('/api/snapshots/%s/diff/%s/' % (old_snapshot.id, new_snapshot.id))
+        self.assertEquals(response["Location"], '/api/snapshots/%s/diff/%s/' % (moved_snapshot_id, new_snapshot.id))
+        diff = self.client.get(response["Location"]).json()
+        self.assertEquals(diff["Sources"], {"added": [], "removed": []})
+        self.assertEquals(diff["Modifications"], {"added": [], "removed": []})
+
+    def test_interrupted_move_is_resumed(self):
+        report_id = self.create_report('Report', nb_sources=2)
+        report = Report.objects.using(shard_for_id(report_id)).get(id=report_id)
+        shard = [shard for shard in get_shards() if shard != report._state.db][0]
+
+        with mock.patch.object(Report, 'delete', side_effect=RuntimeError("stopped")):
+            with self.assertRaises(RuntimeError):
+                move_report(report, shard)
+        copy_id = ReportMove.objects.get(report_id=report_id).new_report_id
+        self.assertTrue(Report.objects.using(shard).filter(id=copy_id).exists())
+        self.assertEquals([r["id"] for r in self.client.get('/api/reports/').json()["Reports : "]], [report_id])
+        self.assertEquals(self.client.get('/api/rollups/?year=2023&to=2023').json()["Rollup"]["Source 0"]["2023"], 230)
+
+        call_command('shards', 'resume', verbosity=0, stdout=open('/dev/null', 'w'))
+        self.assertEquals(Report.objects.using(shard).get().id, copy_id)
+        self.assertEquals(Source.objects.using(shard).count(), 2)
+        self.assertFalse(Report.objects.using(report._state.db).exists())
+        self.assertEquals([r["id"] for r in self.client.get('/api/reports/').json()["Reports : "]], [copy_id])
+        self.assertIsNotNone(ReportMove.objects.get(report_id=report_id).finished_at)
+
+    def test_admin_forms_use_the_shard_of_the_object(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        report_id = next(i for i in (self.create_report('Report') for _ in get_shards()) if shard_for_id(i) != get_shards()[0])
+        shard = shard_for_id(report_id)
+        source = Source.objects.using(shard).get(report=report_id)
+        modif = Modification.objects.using(shard).get(source=source)
+        fields = {
+            'report': report_id, 'description': 'Changed', 'value': 10, 'emission_factor': 2.0,
+            'total_emission': 1000, 'lifetime': 5, 'acquisition_year': 2020,
+            'modification_set-TOTAL_FORMS': 0, 'modification_set-INITIAL_FORMS': 0,
+        }
+
+        response = self.client.post('/admin/api/source/%s/change/' % source.id, dict(fields, **{
+            'modification_set-TOTAL_FORMS': 1, 'modification_set-INITIAL_FORMS': 1,
+            'modification_set-0-id': modif.id, 'modification_set-0-source': source.id, 'modification_set-0-ratio': 1,
+            'modification_set-0-description': 'modif', 'modification_set-0-emission_factor': 1,
+            'modification_set-0-total_emission': 60, 'modification_set-0-acquisition_year': '2023-02-23',
+            'modification_set-0-lifetime': 3,
+        }))
+        self.assertEquals(response.status_code, 302)
+        self.assertEquals(Source.objects.using(shard).get(id=source.id).description, 'Changed')
+
+        response = self.client.post('/admin/api/source/add/', dict(fields, description='Added'))
+        self.assertEquals(response.status_code, 302)
+        self.assertEquals(shard_for_id(Source.objects.using(shard).get(description='Added').id), shard)
+
+        response = self.client.post('/admin/api/modification/%s/change/' % modif.id, {
+            'source': source.id, 'description': 'Changed', 'ratio': 1, 'emission_factor': 1,
+            'total_emission': 60, 'acquisition_year': '2023-02-23', 'lifetime': 3,
+        })
+        self.assertEquals(response.status_code, 302)
+        self.assertEquals(Modification.objects.using(shard).get(id=modif.id).description, 'Changed')
+
+    def test_profile_captures_queries_of_every_shard(self):
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'staff', is_staff=True))
+        for i in range(len(get_shards())):
+            self.create_report('Report %s' % i)
+        response = self.client.get('/api/reports/?profile=').json()
+        self.assertEquals({query["database"] for query in response["queries"] if '"api_report"' in query["sql"]}, set(get_shards()))
+
+    def test_change_log_follows_the_shard_transaction(self):
+        report_id = next(i for i in (self.create_report('Report') for _ in get_shards()) if shard_for_id(i) != get_shards()[0])
+        shard = shard_for_id(report_id)
+        report = Report.objects.using(shard).get(id=report_id)
+        nb_entries = ChangeLogEntry.objects.count()
+
+        with self.assertRaises(IntegrityError):
+            rollover_report(report, '2024-01-01', modification_overrides={'lifetime': -1})
+        self.assertEquals(ChangeLogEntry.objects.count(), nb_entries)
+
+        with self.assertRaises(RuntimeError), transaction.atomic(using=shard):
+            report.delete()
+            raise RuntimeError("rolled back")
+        self.assertEquals(ChangeLogEntry.objects.count(), nb_entries)
+
+        report = Report.objects.using(shard).get(id=report_id)
+        with self.captureOnCommitCallbacks(using=shard, execute=True):
+            report.delete()
+        self.assertEquals(ChangeLogEntry.objects.filter(action=ChangeLogEntry.DELETE, report_id=report_id).count(), 3)
+
+
+class TestShardsConfiguration(SimpleTestCase):
+
+    def test_unknown_shard(self):
+        with override_settings(REPORT_SHARDS=['default', 'missing']):
+            with self.assertRaises(ImproperlyConfigured):
+                check_shards()
+
+    def test_unsupported_vendor(self):
+        connections = {'default': mock.Mock(vendor='sqlite'), 'other': mock.Mock(vendor='mysql')}
+        with override_settings(REPORT_SHARDS=['default', 'other']):
+            with mock.patch('api.sharding.connections', connections):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_shards()
+                connections['other'].vendor = 'postgresql'
+                check_shards()
@@ -0,0 +1,97 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from api.models import Report, Source, Modification, ReportSnapshot
+from api.snapshots import take_snapshot
+
+class TestSnapshots(TestCase):
+
+    def setUp(self):
+        self.report1 = Report.objects.create(
+            name='Report 1',
+            date='2020-02-23'
+        )
+        self.source1 = Source.objects.create(
+            report = self.report1,
+            description = 'Source 1',
+            value = 10,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2020
+        )
+        Modification.objects.create(
+            source = self.source1,
+            description = 'modif 1',
+            emission_factor = 1,
+            total_emission = 60,
+            acquisition_year = '2023-02-23',
+            lifetime = 3,
+        )
+
+    def create_snapshot(self, year, to):
+        response = self.client.post('/api/reports/%s/snapshots/' % self.report1.id, {'year': year, 'to': to})
+        self.assertEquals(response.status_code, 201)
+        return response.json()["Snapshot created"]
+
+    def test_snapshot_matches_live_values(self):
+        snapshot = self.create_snapshot(2020, 2026)
+        live = self.client.get('/api/reports/%s/?year=2020&to=2026&snapshot=live' % self.report1.id).json()
+
+        self.assertEquals(snapshot["totals"], live["List of emission "])
+        self.assertEquals(snapshot["deltas"]["2020"], live["Delta "])
+        self.assertEquals(snapshot["totals"]["2023"], 230)     # 200 + 20 + 10
+
+    def test_snapshotted_years_are_not_recomputed(self):
+        snapshot = self.create_snapshot(2020, 2023)
+        Source.objects.create(
+            report = self.report1,
+            description = 'Source 2',
+            value = 30,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2022
+        )
+
+        response = self.client.get('/api/reports/%s/?year=2022&to=2024' % self.report1.id).json()
+        self.assertEquals(response["Snapshot "], snapshot["id"])
+        self.assertEquals(response["List of emission "]["2022"], 220)           # frozen, without source 2
+        self.assertEquals(response["List of emission "]["2024"], 490)   # not in the snapshot, computed live: 200 + 20 + 10 + 200 + 60
+
+        with self.assertRaises(ValueError):
+            stored = ReportSnapshot.objects.get(id=snapshot["id"])
+            stored.name = 'changed'
+            stored.save()
+
+    def test_snapshot_diff(self):
+        first = self.create_snapshot(2020, 2023)
+        source2 = Source.objects.create(
+            report = self.report1,
+            description = 'Source 2',
+            value = 30,
+            emission_factor = 2.0,
+            total_emission = 1000,
+            lifetime = 5,
+            acquisition_year = 2022
+        )
+        second = self.create_snapshot(2020, 2023)
+
+        diff = self.client.get('/api/snapshots/%s/diff/%s/' % (first["id"], second["id"])).json()
+        self.assertEquals(diff["List of emission"]["2021"]["difference"], 0)
+        self.assertEquals(diff["List of emission"]["2022"]["difference"], 260)  # 200 + 60
+        self.assertEquals(diff["Total Emission"]["difference"], 1000)
+        self.assertEquals(diff["Sources"], {"added": [source2.id], "removed": []})
+
+    def test_snapshot_inputs_are_the_rows_used(self):
+        with CaptureQueriesContext(connection) as context:
+            snapshot = take_snapshot(self.report1, 2020, 2026)
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEquals(len(selects), 2)     # the sources and the modifications, read once
+
+        snapshot.refresh_from_db()
+
+        self.assertEquals([row["id"] for row in snapshot.inputs["Sources"]], [self.source1.id])
+        self.assertEquals(snapshot.inputs["Sources"][0]["report_id"], self.report1.id)
+        self.assertEquals(snapshot.inputs["Modifications"][0]["source_id"], self.source1.id)
+        self.assertEquals(snapshot.inputs["Modifications"][0]["acquisition_year"], '2023-02-23')
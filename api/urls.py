@@ -1,10 +1,21 @@
 from django.urls import path
-from .views import ReportList, ReportDetail, SourceList, SourceDetail
+from .views import (
+    ReportList, ReportDetail, ReportRollover, ReportJobList, JobDetail, ReportSnapshotList, SnapshotDetail, SnapshotDiff,
+    SourceList, SourceDetail, EmissionRollup, ChangeFeed,
+)
 
 #endpoints
 urlpatterns = [
     path('reports/', ReportList.as_view()),
     path('reports/<int:report_id>/', ReportDetail.as_view()),
+    path('reports/<int:report_id>/rollover/', ReportRollover.as_view()),
+    path('reports/<int:report_id>/jobs/', ReportJobList.as_view()),
+    path('reports/<int:report_id>/snapshots/', ReportSnapshotList.as_view()),
+    path('jobs/<uuid:job_id>/', JobDetail.as_view()),
+    path('snapshots/<int:snapshot_id>/', SnapshotDetail.as_view()),
+    path('snapshots/<int:snapshot_id>/diff/<int:other_id>/', SnapshotDiff.as_view()),
+    path('rollups/', EmissionRollup.as_view()),
+    path('changes/', ChangeFeed.as_view()),
     path('sources/', SourceList.as_view()),
     path('sources/<int:source_id>/', SourceDetail.as_view()),
 ]
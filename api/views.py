@@ -1,17 +1,70 @@
+from datetime import date
+
+from django.db.models import Q
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-from .models import Report, Source, Modification
-from .serializers import ReportSerializer, SourceSerializer, ModificationSerializer
+from . import emissions
+from .jobs import QueueFull, submit_job, get_expiry_limit
+from .models import Report, Source, Modification, ProjectionJob, ReportSnapshot, ChangeLogEntry
+from .serializers import (
+    ReportSerializer, SourceSerializer, ModificationSerializer, ProjectionJobSerializer, ReportSnapshotSerializer,
+    ChangeLogEntrySerializer,
+)
+from .rollover import SOURCE_FIELDS, MODIFICATION_FIELDS, check_overrides, rollover_report
+from .rollups import GROUP_BY_FIELDS, get_rollup, filter_reports, merge_rollups
+from .sharding import get_shards, shard_for_id, group_ids_by_shard, get_moving_copies, get_new_id
+from .snapshots import take_snapshot, diff_snapshots
+
+def get_moved_response(request, model, ids, key):
+    '''
+        Redirects (301) to the same url with the new ids when a row of `ids` was moved to another
+        shard (see sharding.move_report). Returns None when none was moved.
+    '''
+    path = request.path
+    new_ids = []
+    for old_id in ids:
+        new_id = get_new_id(model, old_id)
+        if new_id is not None:
+            path = path.replace("/%s/" % old_id, "/%s/" % new_id, 1)
+        new_ids.append(new_id or old_id)
+    if path == request.path:
+        return None
+    return Response({key: new_ids[0] if len(new_ids) == 1 else new_ids}, status=status.HTTP_301_MOVED_PERMANENTLY, headers={"Location": path})
+
+def get_period_sums(request, list_of_emission, year):
+    '''
+        Cumulative (?cumulative=true) and windowed (?window=<number of years>) sums of `list_of_emission`,
+        read from its prefix sums. Returns (cumulative, windows), None for the ones not asked.
+        Raises ValueError when the parameters are invalid.
+    '''
+    cumulative = request.query_params.get('cumulative') in ('true', '1')
+    window = request.query_params.get('window')
+    if not cumulative and window is None:
+        return None, None
+    if year is None:
+        raise ValueError("ERROR: cumulative and window sums need a year")
+    if window is not None:
+        if not window.isdigit() or int(window) < 1:
+            raise ValueError("ERROR: window must be a positive number of years")
+        window = int(window)
+
+    end = max(list_of_emission)
+    prefix = emissions.get_prefix_sums(list_of_emission, year, end)
+    return (
+        emissions.get_cumulative(prefix, year, end) if cumulative else None,
+        emissions.get_windows(prefix, year, end, window) if window is not None else None,
+    )
 
 class ReportList(APIView):
     def get(self, request, *args, **kwargs):
         '''
-            List all the Report items
+            List all the Report items, of every shard (without the copies of the moves in progress)
         '''
-        reports = Report.objects.all()
+        copies = get_moving_copies()
+        reports = [report for shard in get_shards() for report in Report.objects.using(shard).exclude(id__in=copies)]
         serializer = ReportSerializer(reports, many=True)
         return Response({"Reports : ":serializer.data}, status=status.HTTP_200_OK)
     
@@ -33,61 +86,336 @@ class ReportList(APIView):
 class ReportDetail(APIView):
 
     def get(self, request, report_id, *args, **kwargs):
-        instance = Report.objects.filter(id=report_id).first()
+        db = shard_for_id(report_id)
+        instance = Report.objects.using(db).filter(id=report_id).first()
         if instance is None:
-            return Response({"Report doesn't exist"})
+            return get_moved_response(request, Report, [report_id], "Report moved, new id : ") or Response({"Report doesn't exist"})
 
-        sources = Source.objects.filter(report=report_id)
+        sources = Source.objects.using(db).filter(report=report_id)
         
         year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
-        total_emission = instance.get_total_emissions(year, sources)
-        delta = instance.get_delta(year, sources)
+        to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
+
+        # Closed years are read from the latest snapshot of the report (or the one given
+        # with ?snapshot=<id>), ?snapshot=live recomputes everything
+        snapshot_param = request.query_params.get('snapshot')
+        if snapshot_param == 'live':
+            snapshot = None
+        elif snapshot_param is not None:
+            snapshot = ReportSnapshot.objects.using(db).filter(report=instance, id=int(snapshot_param)).first()
+            if snapshot is None:
+                return Response({"Snapshot doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            snapshot = instance.get_latest_snapshot()
+
+        list_of_emission = instance.get_list_of_emission(year, to, sources, snapshot)
+        total_emission = list_of_emission[year]
+        if snapshot is not None and year is not None and snapshot.covers(year):
+            delta = snapshot.deltas[str(year)]
+        else:
+            delta = instance.get_delta(year, sources)
 
-        list_of_emission = {year: total_emission}
-        if year is not None:
-            to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
-            if to is not None and to > year:
-                for i in range(year+1, to+1):
-                    list_of_emission[i] = instance.get_total_emissions(i, sources)
+        try:
+            cumulative, windows = get_period_sums(request, list_of_emission, year)
+        except ValueError as e:
+            return Response({str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = ReportSerializer(instance)
         sources_serializer = SourceSerializer(sources, many=True)
 
-        return Response(
-            {
-                "Report ": serializer.data, 
-                "Sources ": sources_serializer.data, 
-                "Total Emission ": total_emission,
-                "Delta ": delta,
-                "List of emission ": list_of_emission
-            }, 
-            status=status.HTTP_200_OK
-        )
+        data = {
+            "Report ": serializer.data, 
+            "Sources ": sources_serializer.data, 
+            "Total Emission ": total_emission,
+            "Delta ": delta,
+            "List of emission ": list_of_emission,
+            "Snapshot ": snapshot.id if snapshot is not None else None
+        }
+        if cumulative is not None:
+            data["Cumulative emission "] = cumulative
+        if windows is not None:
+            data["Window emission "] = windows
+        return Response(data, status=status.HTTP_200_OK)
     
     def delete(self, request, report_id, *args, **kwargs):
         '''
             Deletes the report item
         '''
-        report_instance = Report.objects.get(id=report_id)
+        report_instance = Report.objects.using(shard_for_id(report_id)).get(id=report_id)
         if not report_instance:
             return Response( {"res": "Object with report id does not exists"}, status=status.HTTP_400_BAD_REQUEST)
         report_instance.delete()
         return Response( {"res": "Report deleted!"}, status=status.HTTP_200_OK )
 
+class ReportRollover(APIView):
+
+    def post(self, request, report_id, *args, **kwargs):
+        '''
+            Create next year's report: clone the report with all its sources and modifications
+            {
+                "name": "report 2024",
+                "date": "2024-04-19",
+                "source_overrides": {"emission_factor": 8.5},
+                "modification_overrides": {}
+            }
+        '''
+        instance = Report.objects.using(shard_for_id(report_id)).filter(id=report_id).first()
+        if instance is None:
+            return Response({"Report doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        source_overrides = request.data.get('source_overrides') or {}
+        modification_overrides = request.data.get('modification_overrides') or {}
+        invalid = check_overrides(source_overrides, SOURCE_FIELDS) + check_overrides(modification_overrides, MODIFICATION_FIELDS)
+        if invalid:
+            return Response({"ERROR: these fields cannot be overridden: " + ", ".join(invalid)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The values are validated as the fields of a source and of a modification
+        source_overrides_serializer = SourceSerializer(data=source_overrides, partial=True)
+        modification_overrides_serializer = ModificationSerializer(data=modification_overrides, partial=True)
+        source_overrides_valid = source_overrides_serializer.is_valid()
+        if not (modification_overrides_serializer.is_valid() and source_overrides_valid):
+            return Response(
+                {
+                    "Source overrides error : ": source_overrides_serializer.errors,
+                    "Modification overrides error : ": modification_overrides_serializer.errors,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = ReportSerializer(data={
+            'name': request.data.get('name', instance.name),
+            'date': request.data.get('date'),
+        })
+        if not serializer.is_valid():
+            return Response({"Report error : ": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        new_report, nb_sources, nb_modifications = rollover_report(
+            instance, serializer.validated_data['date'], serializer.validated_data.get('name'),
+            source_overrides_serializer.validated_data, modification_overrides_serializer.validated_data
+        )
+        return Response(
+            {
+                "Report created : ": ReportSerializer(new_report).data,
+                "Sources cloned": nb_sources,
+                "Modifications cloned": nb_modifications,
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+class ReportJobList(APIView):
+
+    def post(self, request, report_id, *args, **kwargs):
+        '''
+            Submit the projection of the report over `year..to` to the worker pool.
+            Returns the job to poll on /api/jobs/<job_id>/
+            {
+                "year": 2020,
+                "to": 2050
+            }
+        '''
+        instance = Report.objects.using(shard_for_id(report_id)).filter(id=report_id).first()
+        if instance is None:
+            return Response({"Report doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        year = request.data.get('year', request.query_params.get('year'))
+        to = request.data.get('to', request.query_params.get('to'))
+        year = int(year) if year is not None else None
+        to = int(to) if to is not None and year is not None else None
+
+        try:
+            job, created = submit_job(instance, year, to)
+        except QueueFull:
+            return Response({"ERROR: too many projection jobs are waiting, retry later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        serializer = ProjectionJobSerializer(job)
+        return Response({"Job": serializer.data}, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+class JobDetail(APIView):
+
+    def get(self, request, job_id, *args, **kwargs):
+        '''
+            Returns the status of a projection job, and its result once it is done
+        '''
+        job = None
+        for shard in get_shards():
+            job = ProjectionJob.objects.using(shard).filter(id=job_id).first()
+            if job is not None:
+                break
+        if job is None or (job.finished_at is not None and job.finished_at < get_expiry_limit()):
+            return Response({"Job doesn't exist or has expired"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ProjectionJobSerializer(job)
+        return Response({"Job": serializer.data}, status=status.HTTP_200_OK)
+
+class ReportSnapshotList(APIView):
+
+    def get(self, request, report_id, *args, **kwargs):
+        '''
+            List the snapshots of the report
+        '''
+        snapshots = ReportSnapshot.objects.using(shard_for_id(report_id)).filter(report=report_id).defer('inputs').order_by('-created_at', '-id')
+        serializer = ReportSnapshotSerializer(snapshots, many=True)
+        return Response({"Snapshots": serializer.data}, status=status.HTTP_200_OK)
+
+    def post(self, request, report_id, *args, **kwargs):
+        '''
+            Freeze the totals and deltas of the report from `year` to `to`
+            {
+                "name": "closing 2023",
+                "year": 2020,
+                "to": 2023
+            }
+        '''
+        instance = Report.objects.using(shard_for_id(report_id)).filter(id=report_id).first()
+        if instance is None:
+            return Response({"Report doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        year = request.data.get('year')
+        if year is None:
+            return Response({"ERROR: the first year of the snapshot is required"}, status=status.HTTP_400_BAD_REQUEST)
+        to = request.data.get('to')
+
+        snapshot = take_snapshot(instance, int(year), int(to) if to is not None else None, request.data.get('name'))
+        serializer = ReportSnapshotSerializer(snapshot)
+        return Response({"Snapshot created": serializer.data}, status=status.HTTP_201_CREATED)
+
+class SnapshotDetail(APIView):
+
+    def get(self, request, snapshot_id, *args, **kwargs):
+        snapshot = ReportSnapshot.objects.using(shard_for_id(snapshot_id)).filter(id=snapshot_id).first()
+        if snapshot is None:
+            return (
+                get_moved_response(request, ReportSnapshot, [snapshot_id], "Snapshot moved, new id")
+                or Response({"Snapshot doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+            )
+
+        serializer = ReportSnapshotSerializer(snapshot)
+        return Response({"Snapshot": serializer.data, "Inputs": snapshot.inputs}, status=status.HTTP_200_OK)
+
+class SnapshotDiff(APIView):
+
+    def get(self, request, snapshot_id, other_id, *args, **kwargs):
+        '''
+            Compare two snapshots, the differences are computed as `other - snapshot`
+        '''
+        snapshot_from = ReportSnapshot.objects.using(shard_for_id(snapshot_id)).filter(id=snapshot_id).first()
+        snapshot_to = ReportSnapshot.objects.using(shard_for_id(other_id)).filter(id=other_id).first()
+        if snapshot_from is None or snapshot_to is None:
+            return (
+                get_moved_response(request, ReportSnapshot, [snapshot_id, other_id], "Snapshots moved, new ids")
+                or Response({"Snapshot doesn't exist"}, status=status.HTTP_404_NOT_FOUND)
+            )
+
+        return Response(diff_snapshots(snapshot_from, snapshot_to), status=status.HTTP_200_OK)
+
+class EmissionRollup(APIView):
+
+    def get(self, request, *args, **kwargs):
+        '''
+            Total emissions by year of the sources of several reports, grouped by `group_by`
+            (description, report or acquisition_year).
+            Filters: report=1,2,3  date_from=2020-01-01  date_to=2023-12-31  key=Voiture,Avion
+            Example: /api/rollups/?group_by=description&year=2020&to=2030&date_from=2023-01-01
+        '''
+        group_by = request.query_params.get('group_by', 'description')
+        if group_by not in GROUP_BY_FIELDS:
+            return Response({"ERROR: group_by must be one of " + ", ".join(GROUP_BY_FIELDS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
+        to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
+        report_ids = [int(i) for i in request.query_params.get('report').split(',')] if request.query_params.get('report') else None
+        keys = request.query_params.get('key').split(',') if request.query_params.get('key') else None
+        if keys and group_by != 'description':
+            keys = [int(key) for key in keys]
+
+        rollups = []
+        copies = get_moving_copies()
+        for shard in get_shards():
+            reports = filter_reports(report_ids, request.query_params.get('date_from'), request.query_params.get('date_to'), shard, copies)
+            rollups.append(get_rollup(reports, group_by, year, to, keys, shard))
+        rollup = merge_rollups(rollups)
+        return Response({"Group by": group_by, "Rollup": rollup}, status=status.HTTP_200_OK)
+
+class ChangeFeed(APIView):
+    MAX_LIMIT = 1000
+
+    def get(self, request, *args, **kwargs):
+        '''
+            Creates and deletes of reports, sources and modifications after the cursor `after`,
+            oldest first, by pages of `limit` changes (100 by default, 1000 at most).
+            Call again with the returned "Cursor" until "Has more" is false.
+            Example: /api/changes/?after=1520&limit=500&model=source
+        '''
+        after = request.query_params.get('after', '0')
+        if not after.isdigit():
+            return Response({"ERROR: after must be a change id"}, status=status.HTTP_400_BAD_REQUEST)
+        after = int(after)
+        limit = request.query_params.get('limit', '100')
+        if not limit.isdigit() or int(limit) < 1:
+            return Response({"ERROR: limit must be a positive number"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(int(limit), self.MAX_LIMIT)
+
+        changes = ChangeLogEntry.objects.filter(id__gt=after).order_by('id')
+        if request.query_params.get('model') is not None:
+            changes = changes.filter(model=request.query_params.get('model'))
+        changes = list(changes[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        serializer = ChangeLogEntrySerializer(changes, many=True)
+        return Response(
+            {
+                "Changes": serializer.data,
+                "Cursor": changes[-1].id if changes else after,
+                "Has more": has_more,
+            },
+            status=status.HTTP_200_OK
+        )
+
 class SourceList(APIView):
 
     def get(self, request, *args, **kwargs):
         '''
             List all the Source items
+            With `ids`, returns the projection of each of these sources, computed from one load
+            of the sources and one of their modifications
+            Example: /api/sources/?ids=100,101,102&year=2022&to=2025
         '''
+        if request.query_params.get('ids'):
+            return self.get_projections(request)
+
         report = request.query_params.get('report')
         if report is not None:
-            sources = Source.objects.filter(report=report)
+            sources = Source.objects.using(shard_for_id(report)).filter(report=report)
         else:
-            sources = Source.objects.all()
+            sources = [source for shard in get_shards() for source in Source.objects.using(shard).all()]
         serializer = SourceSerializer(sources, many=True)
         return Response({"Sources ":serializer.data}, status=status.HTTP_200_OK)
     
+    def get_projections(self, request):
+        source_ids = [int(i) for i in request.query_params.get('ids').split(',')]
+        year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
+        to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
+
+        sources = []
+        modifs_by_source = {}
+        for shard, shard_source_ids in group_ids_by_shard(source_ids).items():
+            sources += Source.objects.using(shard).filter(id__in=shard_source_ids)
+            modifs_by_source.update(emissions.load_modifications(Modification.objects.using(shard).filter(source__in=shard_source_ids)))
+
+        projections = {}
+        for source, data in zip(sources, SourceSerializer(sources, many=True).data):
+            total_emission, delta, list_of_emission = emissions.get_projection(source, modifs_by_source.get(source.id, []), year, to)
+            projections[source.id] = {
+                "Source": data,
+                "Total Emission": total_emission,
+                "Delta": delta,
+                "List of emission": list_of_emission,
+            }
+        missing = [source_id for source_id in source_ids if source_id not in projections]
+
+        return Response({"Sources ": projections, "Missing ": missing}, status=status.HTTP_200_OK)
+
     def post(self, request, *args, **kwargs):
         '''
             Create the Source with given data
@@ -109,41 +437,82 @@ class SourceList(APIView):
         return Response({"Error ": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
         
 class SourceDetail(APIView):
+    MODIFICATIONS_LIMIT = 100
+    MODIFICATIONS_MAX_LIMIT = 1000
 
     def get(self, request, source_id, *args, **kwargs):
-
-        source_instance = Source.objects.filter(id=source_id).first()
+        '''
+            Returns the source, its emissions, and its modifications ordered by acquisition date, by
+            pages of `limit` (100 by default, 1000 at most). Call again with the returned "Cursor"
+            until "Has more" is false.
+            Example: /api/sources/100/?year=2022&to=2025&cursor=2023-09-22_105
+        '''
+        db = shard_for_id(source_id)
+        source_instance = Source.objects.using(db).filter(id=source_id).first()
         if source_instance is None:
-            return Response({"Source doesn't exist"})
-        
-        modif_list = Modification.objects.filter(source=source_id).order_by("acquisition_year")
+            return get_moved_response(request, Source, [source_id], "Source moved, new id ") or Response({"Source doesn't exist"})
 
-        year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
-        total_emission = source_instance.get_total_emissions(year, modif_list)
-        delta = source_instance.get_delta(year, modif_list)
+        # The whole history is loaded once, as light tuples, and only the page of
+        # modifications returned is loaded as model instances
+        modifs = emissions.load_modifications(Modification.objects.using(db).filter(source=source_id)).get(source_instance.id, [])
 
-        year2 = year if year is not None else "total"
-        list_of_emission = {year2: total_emission}
-        if year is not None:
-            to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
-            if to is not None and to > year:
-                for i in range(year+1, to+1):
-                    list_of_emission[i] = source_instance.get_total_emissions(i, modif_list)
+        year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
+        to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
+        total_emission, delta, list_of_emission = emissions.get_projection(source_instance, modifs, year, to)
 
+        try:
+            cumulative, windows = get_period_sums(request, list_of_emission, year)
+            modif_list, cursor, has_more = self.get_modifications_page(request, db, source_instance)
+        except ValueError as e:
+            return Response({str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         source_serializer = SourceSerializer(source_instance)
         modif_serializer = ModificationSerializer(modif_list, many=True)
         
-        return Response(
-            {
-                "Source": source_serializer.data, 
-                "Modifications": modif_serializer.data,
-                "Total Emission": total_emission,
-                "Delta": delta,
-                "List of emission": list_of_emission
-            }, 
-            status=status.HTTP_200_OK
-        )
+        data = {
+            "Source": source_serializer.data, 
+            "Modifications": modif_serializer.data,
+            "Cursor": cursor,
+            "Has more": has_more,
+            "Total Emission": total_emission,
+            "Delta": delta,
+            "List of emission": list_of_emission
+        }
+        if cumulative is not None:
+            data["Cumulative emission"] = cumulative
+        if windows is not None:
+            data["Window emission"] = windows
+        return Response(data, status=status.HTTP_200_OK)
+
+    def get_modifications_page(self, request, db, source_instance):
+        '''
+            Returns the modifications of the source after the cursor `<acquisition date>_<id>`,
+            the cursor of the next page and whether there are more.
+            Raises ValueError when the parameters are invalid.
+        '''
+        limit = request.query_params.get('limit', str(self.MODIFICATIONS_LIMIT))
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("ERROR: limit must be a positive number")
+        limit = min(int(limit), self.MODIFICATIONS_MAX_LIMIT)
+
+        modif_list = Modification.objects.using(db).filter(source=source_instance).order_by('acquisition_year', 'id')
+        cursor = request.query_params.get('cursor')
+        if cursor is not None:
+            try:
+                acquisition_year, modif_id = cursor.split('_')
+                acquisition_year, modif_id = date.fromisoformat(acquisition_year), int(modif_id)
+            except ValueError:
+                raise ValueError("ERROR: invalid cursor")
+            modif_list = modif_list.filter(
+                Q(acquisition_year__gt=acquisition_year) | Q(acquisition_year=acquisition_year, id__gt=modif_id)
+            )
+
+        modif_list = list(modif_list[:limit + 1])
+        has_more = len(modif_list) > limit
+        modif_list = modif_list[:limit]
+        if modif_list:
+            cursor = "%s_%s" % (modif_list[-1].acquisition_year.isoformat(), modif_list[-1].id)
+        return modif_list, cursor, has_more
 
     def post(self, request, source_id, *args, **kwargs):
         '''
@@ -157,8 +526,10 @@ class SourceDetail(APIView):
                 "lifetime": 1,
                 "source": 101
             }
+            With ?impact=true&year=2020&to=2030, also returns the change of the source's and the
+            report's emissions caused by the modification
         '''
-        source_instance = Source.objects.get(id=source_id)
+        source_instance = Source.objects.using(shard_for_id(source_id)).get(id=source_id)
 
         acquisition_year = request.data.get('acquisition_year')
         source_acquisition_year = int(acquisition_year[:4]) 
@@ -177,17 +548,62 @@ class SourceDetail(APIView):
         
         serializer = ModificationSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            modification = serializer.save()
 
-            return Response({"Modification created ": serializer.data}, status=status.HTTP_201_CREATED)
+            data = {"Modification created ": serializer.data}
+            if request.query_params.get('impact') in ('true', '1'):
+                data["Impact"] = self.get_impact(request, source_instance, modification)
+            return Response(data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_impact(self, request, source_instance, modification):
+        '''
+            Change of the emissions caused by `modification`: only its source is evaluated again, with and
+            without it, and the difference is applied to the report, except for the years frozen in its
+            latest snapshot, which the report endpoint does not recompute
+        '''
+        db = source_instance._state.db
+        year = int(request.query_params.get('year')) if request.query_params.get('year') is not None else None
+        to = int(request.query_params.get('to')) if request.query_params.get('to') is not None else None
+
+        modifs = emissions.load_modifications(
+            Modification.objects.using(db).filter(source=source_instance.id).exclude(id=modification.id)
+        )
+        total_emission, delta, list_of_emission = emissions.get_modification_impact(
+            source_instance, modifs.get(source_instance.id, []), modification, year, to
+        )
+        impact = {
+            "Source": {
+                "Total Emission": total_emission,
+                "Delta": delta,
+                "List of emission": list_of_emission,
+            },
+            "Report": None,
+        }
+
+        if source_instance.report_id is not None:
+            snapshot = None
+            if year is not None:
+                snapshot = ReportSnapshot.objects.using(db).filter(report=source_instance.report_id).order_by('-created_at', '-id').first()
+            frozen = snapshot is not None and snapshot.covers(year)
+            impact["Report"] = {
+                "Report": source_instance.report_id,
+                "Total Emission": 0 if frozen else total_emission,
+                "Delta": 0 if frozen else delta,
+                "List of emission": {
+                    key: 0 if snapshot is not None and snapshot.covers(key) else value
+                    for key, value in list_of_emission.items()
+                },
+                "Snapshot": snapshot.id if snapshot is not None else None,
+            }
+        return impact
     
     def delete(self, request, source_id, *args, **kwargs):
         '''
             Deletes the report item
         '''
-        source_instance = Source.objects.get(id=source_id)
+        source_instance = Source.objects.using(shard_for_id(source_id)).get(id=source_id)
         if not source_instance:
             return Response( {"res": "Object with report id does not exists"}, status=status.HTTP_400_BAD_REQUEST)
         source_instance.delete()
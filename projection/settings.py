@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,10 +44,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ThresholdGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,6 +75,28 @@ TEMPLATES = [
 WSGI_APPLICATION = 'projection.wsgi.application'
 
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Responses smaller than this (in bytes) are sent uncompressed
+GZIP_MIN_LENGTH = 1024
+
+# ?profile= (see api.middleware.ProfilingMiddleware): number of lines of statistics returned,
+# and directory where the raw profiles are stored (not stored when None)
+PROFILE_LINES = 50
+PROFILE_DIR = None
+
+# Asynchronous report projections (see api/jobs.py)
+PROJECTION_JOB_WORKERS = 2          # jobs computed at the same time
+PROJECTION_JOB_MAX_PENDING = 100    # queued or running jobs before new ones are refused
+PROJECTION_JOB_TTL = 3600           # seconds a result is kept
+PROJECTION_JOB_TIMEOUT = 600        # seconds after which a running job is considered dead
+
+
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
@@ -82,6 +107,21 @@ DATABASES = {
     }
 }
 
+# Report shards (see api/sharding.py): every report lives, with its sources and modifications,
+# on one of these databases. PROJECTION_SHARDS=3 spreads them over db.sqlite3, db_shard_1.sqlite3
+# and db_shard_2.sqlite3. Run `python3 manage.py shards init` after adding a shard.
+REPORT_SHARDS = ['default'] + ['shard_%s' % i for i in range(1, int(os.environ.get('PROJECTION_SHARDS', 1)))]
+for alias in REPORT_SHARDS[1:]:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / ('db_%s.sqlite3' % alias),
+    }
+
+# Ids of the i-th shard start at i * SHARD_ID_SPAN
+SHARD_ID_SPAN = 10**12
+
+DATABASE_ROUTERS = ['api.routers.ReportShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators